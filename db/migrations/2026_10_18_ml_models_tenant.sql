@@ -0,0 +1,11 @@
+-- Migration: Per-tenant ML models
+-- Date: 2026-10-18
+-- Purpose: Register tenant-scoped models (conversionPredictor.py / sendTimeOptimizer.py --tenant)
+--          next to the global ones. tenant_id NULL = global model.
+
+ALTER TABLE ml_models ADD COLUMN IF NOT EXISTS tenant_id UUID REFERENCES tenants(id);
+
+-- Latest deployed model per (model_name, tenant)
+CREATE INDEX IF NOT EXISTS ml_models_tenant_deployed_idx
+  ON ml_models(model_name, tenant_id, deployed_at DESC)
+  WHERE status = 'deployed';
@@ -0,0 +1,323 @@
+-- Migration: Flattened training feature table
+-- Date: 2026-10-18
+-- Purpose: One typed row per email_outcome with the feature_store JSONB values
+--          already extracted, so the Python trainers (conversionPredictor.py /
+--          explainablePredictor.py --feature-table, or ML_USE_FEATURE_TABLE=1)
+--          read plain columns instead of joining feature_store three times
+--          and casting ~20 JSONB keys on every run.
+--
+-- Kept current incrementally by statement-level triggers:
+--   email_outcomes INSERT/UPDATE  -> re-flatten the inserted/changed outcomes
+--   feature_store INSERT/UPDATE/DELETE -> re-flatten outcomes of the touched
+--                                         companies / people / emails
+--
+-- Not a drop-in copy of the live feature_store query:
+--   * one row per outcome built from the NEWEST feature version of each
+--     entity; the live query joins every version, so an entity with several
+--     feature_store rows yields one training row per combination
+--   * malformed numerics (e.g. "n/a", "3.7" for an int) become the column
+--     default via ml_feature_numeric (0, or a rounded int); the live query's
+--     casts raise and the whole fetch fails
+-- so models trained from either source can differ where feature_store has
+-- duplicate versions or bad values.
+--
+-- Retention: rows are kept for the 180-day training window only.
+-- ml_training_features_prune() deletes older rows (range scan on
+-- ml_training_features_sent_idx); the backfill calls it, and it should also
+-- run daily (cron / Cloud Scheduler): SELECT ml_training_features_prune();
+
+-- =====================================================
+-- 1. TABLE
+-- =====================================================
+CREATE TABLE IF NOT EXISTS ml_training_features (
+  -- Same id as email_outcomes, so training WHERE clauses written against
+  -- "email_outcomes eo" run unchanged against "ml_training_features eo"
+  id UUID PRIMARY KEY REFERENCES email_outcomes(id) ON DELETE CASCADE,
+
+  company_id UUID,
+  person_id UUID,
+  sent_at TIMESTAMPTZ NOT NULL,
+  delivered BOOLEAN,
+  opened BOOLEAN,
+  converted BOOLEAN,
+
+  -- Company features
+  industry TEXT NOT NULL,
+  size_bucket TEXT NOT NULL,
+  uae_presence INTEGER NOT NULL,
+  account_age_days NUMERIC NOT NULL,
+  active_days_90d INTEGER NOT NULL,
+  emails_sent_total INTEGER NOT NULL,
+  company_open_rate NUMERIC NOT NULL,
+  company_reply_rate NUMERIC NOT NULL,
+
+  -- Person features
+  function TEXT NOT NULL,
+  seniority_level TEXT NOT NULL,
+  person_emails_received INTEGER NOT NULL,
+  person_open_rate NUMERIC NOT NULL,
+
+  -- Email features
+  subject_length INTEGER NOT NULL,
+  body_word_count INTEGER NOT NULL,
+  personalization_level INTEGER NOT NULL,
+  readability_score NUMERIC NOT NULL,
+  has_cta INTEGER NOT NULL,
+  spam_words_count INTEGER NOT NULL,
+
+  -- Time features
+  send_hour SMALLINT NOT NULL,
+  send_day_of_week SMALLINT NOT NULL,
+
+  -- Newest computed_at among the feature rows used
+  features_computed_at TIMESTAMPTZ,
+  refreshed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ml_training_features_sent_idx ON ml_training_features(sent_at DESC);
+CREATE INDEX IF NOT EXISTS ml_training_features_company_idx ON ml_training_features(company_id);
+CREATE INDEX IF NOT EXISTS ml_training_features_person_idx ON ml_training_features(person_id);
+
+-- =====================================================
+-- 2. FLATTENING
+-- =====================================================
+
+-- JSONB number -> NUMERIC, NULL (not an error) for missing or malformed
+-- values so a bad feature row can never fail the write that fired a trigger
+CREATE OR REPLACE FUNCTION ml_feature_numeric(features JSONB, key TEXT)
+RETURNS NUMERIC AS $$
+  SELECT CASE
+    WHEN features->>key ~ '^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+    THEN (features->>key)::numeric
+  END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Re-flatten the given outcomes; returns the number of rows written
+CREATE OR REPLACE FUNCTION ml_training_features_upsert(outcome_ids UUID[])
+RETURNS INTEGER AS $$
+  WITH upserted AS (
+    INSERT INTO ml_training_features (
+      id, company_id, person_id, sent_at, delivered, opened, converted,
+      industry, size_bucket, uae_presence, account_age_days, active_days_90d,
+      emails_sent_total, company_open_rate, company_reply_rate,
+      function, seniority_level, person_emails_received, person_open_rate,
+      subject_length, body_word_count, personalization_level, readability_score,
+      has_cta, spam_words_count,
+      send_hour, send_day_of_week,
+      features_computed_at, refreshed_at
+    )
+    SELECT
+      eo.id, eo.company_id, eo.person_id, eo.sent_at, eo.delivered, eo.opened, eo.converted,
+
+      COALESCE(fs_company.features->>'industry', 'unknown'),
+      COALESCE(fs_company.features->>'size_bucket', 'unknown'),
+      COALESCE(ml_feature_numeric(fs_company.features, 'uae_presence')::int, 0),
+      COALESCE(ml_feature_numeric(fs_company.features, 'account_age_days'), 0),
+      COALESCE(ml_feature_numeric(fs_company.features, 'active_days_90d')::int, 0),
+      COALESCE(ml_feature_numeric(fs_company.features, 'emails_sent_total')::int, 0),
+      COALESCE(ml_feature_numeric(fs_company.features, 'open_rate'), 0),
+      COALESCE(ml_feature_numeric(fs_company.features, 'reply_rate'), 0),
+
+      COALESCE(fs_person.features->>'function', 'unknown'),
+      COALESCE(fs_person.features->>'seniority_level', 'unknown'),
+      COALESCE(ml_feature_numeric(fs_person.features, 'person_emails_received')::int, 0),
+      COALESCE(ml_feature_numeric(fs_person.features, 'person_open_rate'), 0),
+
+      COALESCE(ml_feature_numeric(fs_email.features, 'subject_length')::int, 0),
+      COALESCE(ml_feature_numeric(fs_email.features, 'body_word_count')::int, 0),
+      COALESCE(ml_feature_numeric(fs_email.features, 'personalization_level')::int, 0),
+      COALESCE(ml_feature_numeric(fs_email.features, 'readability_score'), 0),
+      COALESCE(ml_feature_numeric(fs_email.features, 'has_cta')::int, 0),
+      COALESCE(ml_feature_numeric(fs_email.features, 'spam_words_count')::int, 0),
+
+      EXTRACT(HOUR FROM eo.sent_at),
+      EXTRACT(DOW FROM eo.sent_at),
+
+      GREATEST(fs_company.computed_at, fs_person.computed_at, fs_email.computed_at),
+      NOW()
+
+    FROM email_outcomes eo
+    LEFT JOIN LATERAL (
+      SELECT features, computed_at FROM feature_store
+      WHERE entity_type = 'company' AND entity_id = eo.company_id
+      ORDER BY computed_at DESC LIMIT 1
+    ) fs_company ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT features, computed_at FROM feature_store
+      WHERE entity_type = 'person' AND entity_id = eo.person_id
+      ORDER BY computed_at DESC LIMIT 1
+    ) fs_person ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT features, computed_at FROM feature_store
+      WHERE entity_type = 'email' AND entity_id = eo.id
+      ORDER BY computed_at DESC LIMIT 1
+    ) fs_email ON TRUE
+    WHERE eo.id = ANY(outcome_ids)
+
+    ON CONFLICT (id) DO UPDATE SET
+      company_id = EXCLUDED.company_id,
+      person_id = EXCLUDED.person_id,
+      sent_at = EXCLUDED.sent_at,
+      delivered = EXCLUDED.delivered,
+      opened = EXCLUDED.opened,
+      converted = EXCLUDED.converted,
+      industry = EXCLUDED.industry,
+      size_bucket = EXCLUDED.size_bucket,
+      uae_presence = EXCLUDED.uae_presence,
+      account_age_days = EXCLUDED.account_age_days,
+      active_days_90d = EXCLUDED.active_days_90d,
+      emails_sent_total = EXCLUDED.emails_sent_total,
+      company_open_rate = EXCLUDED.company_open_rate,
+      company_reply_rate = EXCLUDED.company_reply_rate,
+      function = EXCLUDED.function,
+      seniority_level = EXCLUDED.seniority_level,
+      person_emails_received = EXCLUDED.person_emails_received,
+      person_open_rate = EXCLUDED.person_open_rate,
+      subject_length = EXCLUDED.subject_length,
+      body_word_count = EXCLUDED.body_word_count,
+      personalization_level = EXCLUDED.personalization_level,
+      readability_score = EXCLUDED.readability_score,
+      has_cta = EXCLUDED.has_cta,
+      spam_words_count = EXCLUDED.spam_words_count,
+      send_hour = EXCLUDED.send_hour,
+      send_day_of_week = EXCLUDED.send_day_of_week,
+      features_computed_at = EXCLUDED.features_computed_at,
+      refreshed_at = EXCLUDED.refreshed_at
+    RETURNING 1
+  )
+  SELECT COUNT(*)::int FROM upserted;
+$$ LANGUAGE sql;
+
+-- Drop rows outside the retention window (whole days, matching the
+-- trainers' window); returns the number of rows deleted
+CREATE OR REPLACE FUNCTION ml_training_features_prune(retention INTERVAL DEFAULT INTERVAL '180 days')
+RETURNS INTEGER AS $$
+  WITH pruned AS (
+    DELETE FROM ml_training_features
+    WHERE sent_at < date_trunc('day', NOW()) - retention
+    RETURNING 1
+  )
+  SELECT COUNT(*)::int FROM pruned;
+$$ LANGUAGE sql;
+
+-- Full (re)build for outcomes sent since `since` after pruning expired
+-- rows; also the recovery path if the triggers were ever disabled
+CREATE OR REPLACE FUNCTION ml_training_features_backfill(since TIMESTAMPTZ DEFAULT date_trunc('day', NOW()) - INTERVAL '180 days')
+RETURNS INTEGER AS $$
+  SELECT ml_training_features_prune();
+  SELECT ml_training_features_upsert(ARRAY(SELECT id FROM email_outcomes WHERE sent_at >= since));
+$$ LANGUAGE sql;
+
+-- =====================================================
+-- 3. INCREMENTAL MAINTENANCE
+-- =====================================================
+
+-- Statement-level with transition tables: a bulk insert of outcomes is
+-- flattened in one set-based upsert instead of once per row
+CREATE OR REPLACE FUNCTION ml_training_features_sync_outcomes()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM ml_training_features_upsert(ARRAY(SELECT id FROM new_rows));
+  ELSE
+    -- Only outcomes whose flattened columns actually changed
+    PERFORM ml_training_features_upsert(ARRAY(
+      SELECT n.id
+      FROM new_rows n
+      JOIN old_rows o ON o.id = n.id
+      WHERE (n.company_id, n.person_id, n.sent_at, n.delivered, n.opened, n.converted)
+        IS DISTINCT FROM (o.company_id, o.person_id, o.sent_at, o.delivered, o.opened, o.converted)
+    ));
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Feature changes only refresh outcomes already in the table (older ones
+-- are outside every training window)
+CREATE OR REPLACE FUNCTION ml_training_features_sync_features()
+RETURNS TRIGGER AS $$
+DECLARE
+  changed_types TEXT[];
+  changed_ids UUID[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(entity_type), array_agg(entity_id)
+    INTO changed_types, changed_ids
+    FROM new_rows;
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- computed_at-only bumps (same features re-saved) are skipped; a row
+    -- moved to another entity refreshes both the old and the new one
+    SELECT array_agg(c.entity_type), array_agg(c.entity_id)
+    INTO changed_types, changed_ids
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    CROSS JOIN LATERAL (VALUES (n.entity_type, n.entity_id), (o.entity_type, o.entity_id)) c(entity_type, entity_id)
+    WHERE (n.entity_type, n.entity_id, n.features) IS DISTINCT FROM (o.entity_type, o.entity_id, o.features);
+  ELSE
+    SELECT array_agg(entity_type), array_agg(entity_id)
+    INTO changed_types, changed_ids
+    FROM old_rows;
+  END IF;
+
+  IF changed_ids IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  PERFORM ml_training_features_upsert(ARRAY(
+    WITH changed AS (
+      SELECT DISTINCT * FROM unnest(changed_types, changed_ids) AS c(entity_type, entity_id)
+    )
+    SELECT tf.id FROM ml_training_features tf
+    JOIN changed c ON c.entity_type = 'company' AND c.entity_id = tf.company_id
+    UNION
+    SELECT tf.id FROM ml_training_features tf
+    JOIN changed c ON c.entity_type = 'person' AND c.entity_id = tf.person_id
+    UNION
+    SELECT tf.id FROM ml_training_features tf
+    JOIN changed c ON c.entity_type = 'email' AND c.entity_id = tf.id
+  ));
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ml_training_features_outcomes_insert ON email_outcomes;
+CREATE TRIGGER ml_training_features_outcomes_insert
+  AFTER INSERT ON email_outcomes
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION ml_training_features_sync_outcomes();
+
+DROP TRIGGER IF EXISTS ml_training_features_outcomes_update ON email_outcomes;
+CREATE TRIGGER ml_training_features_outcomes_update
+  AFTER UPDATE ON email_outcomes
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION ml_training_features_sync_outcomes();
+
+DROP TRIGGER IF EXISTS ml_training_features_features_insert ON feature_store;
+CREATE TRIGGER ml_training_features_features_insert
+  AFTER INSERT ON feature_store
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION ml_training_features_sync_features();
+
+DROP TRIGGER IF EXISTS ml_training_features_features_update ON feature_store;
+CREATE TRIGGER ml_training_features_features_update
+  AFTER UPDATE ON feature_store
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION ml_training_features_sync_features();
+
+DROP TRIGGER IF EXISTS ml_training_features_features_delete ON feature_store;
+CREATE TRIGGER ml_training_features_features_delete
+  AFTER DELETE ON feature_store
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION ml_training_features_sync_features();
+
+-- =====================================================
+-- 4. BACKFILL
+-- =====================================================
+SELECT ml_training_features_backfill();
+
+COMMENT ON TABLE ml_training_features IS 'Flattened, typed training features per email_outcome (trigger-maintained from email_outcomes + feature_store)';
+COMMENT ON FUNCTION ml_training_features_backfill(TIMESTAMPTZ) IS 'Prune expired rows, then rebuild ml_training_features rows for outcomes sent since `since`';
+COMMENT ON FUNCTION ml_training_features_prune(INTERVAL) IS 'Delete ml_training_features rows older than the retention window; schedule daily';
@@ -135,10 +135,10 @@ class MLService {
    */
   async storePrediction(modelName, entityType, entityId, prediction) {
     try {
-      // Get latest deployed model
+      // Get latest deployed global model
       const model = await pool.query(`
         SELECT id FROM ml_models
-        WHERE model_name = $1 AND status = 'deployed'
+        WHERE model_name = $1 AND status = 'deployed' AND tenant_id IS NULL
         ORDER BY deployed_at DESC
         LIMIT 1
       `, [modelName]);
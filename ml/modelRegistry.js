@@ -87,12 +87,13 @@ class ModelRegistry {
       console.log(`[ModelRegistry] Model ${modelData.model_name} v${modelData.model_version} deployed as CANARY (10% traffic)`);
 
     } else {
-      // Full deployment: archive old model, deploy new one
+      // Full deployment: archive old model (same tenant scope), deploy new one
       await pool.query(`
         UPDATE ml_models
         SET status = 'archived'
         WHERE model_name = $1 AND status = 'deployed'
-      `, [modelData.model_name]);
+          AND tenant_id IS NOT DISTINCT FROM $2
+      `, [modelData.model_name, modelData.tenant_id ?? null]);
 
       await pool.query(`
         UPDATE ml_models
@@ -113,15 +114,16 @@ class ModelRegistry {
   }
 
   /**
-   * Get active model for serving
+   * Get active model for serving (global model unless tenantId is given)
    */
-  async getActiveModel(modelName) {
+  async getActiveModel(modelName, tenantId = null) {
     const result = await pool.query(`
       SELECT * FROM ml_models
       WHERE model_name = $1 AND status IN ('deployed', 'canary')
+        AND tenant_id IS NOT DISTINCT FROM $2
       ORDER BY deployed_at DESC
       LIMIT 1
-    `, [modelName]);
+    `, [modelName, tenantId]);
 
     return result.rows[0] || null;
   }
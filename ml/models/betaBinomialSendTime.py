@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Hierarchical Beta-Binomial Send Time Estimator
+
+Alternative to the RandomForest SendTimeOptimizer. Keeps count arrays of
+opens and sends per (industry, function, day_of_week, hour_of_day) and
+shrinks each cell toward its parent level:
+
+    overall rate -> slot (global) -> industry x slot -> segment x slot
+
+Posterior mean at each level: (opens + k * parent_rate) / (sends + k)
+
+Training is a group-by into the count arrays (milliseconds). The counts
+are also kept as sparse per-sent-day aggregates, so --update matches a
+full train over the 180-day window without refitting: it drops days that
+left the window, re-aggregates the trailing reopen_days days (opens keep
+arriving after a send was absorbed) and adds newer days. Opens arriving
+later than that are only counted by a full train, so schedule one
+periodically (e.g. weekly) next to the frequent updates.
+"""
+
+import pandas as pd
+import numpy as np
+import psycopg2
+from datetime import datetime, timedelta
+import os
+import sys
+import json
+import time
+import argparse
+
+from modelPaths import trained_models_dir
+from sendTimeOptimizer import SendTimeOptimizer
+
+N_DAYS = 7
+N_HOURS = 24
+
+WINDOW_DAYS = 180
+
+# Per-day aggregate rows: sent day (days since epoch), cell indices, counts
+DAILY_KEYS = ['day', 'industry', 'function', 'day_of_week', 'hour_of_day']
+DAILY_EMPTY = pd.DataFrame({column: np.zeros(0, dtype=np.int64) for column in DAILY_KEYS + ['opens', 'sends']})
+
+
+def epoch_days(values):
+    """Dates (or date-like values) as integer days since 1970-01-01"""
+
+    return pd.to_datetime(pd.Series(values)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+class BetaBinomialSendTimeEstimator:
+
+    def __init__(self, db_config, global_prior=(3.0, 7.0), slot_strength=50.0,
+                 industry_strength=20.0, segment_strength=10.0, maturity_days=2, reopen_days=7):
+        self.db_config = db_config
+
+        # Beta(a, b) prior on the overall open rate (mean 0.3, like the dummy model)
+        self.global_prior = global_prior
+        # Pseudo-sends pulling each level toward its parent
+        self.slot_strength = slot_strength
+        self.industry_strength = industry_strength
+        self.segment_strength = segment_strength
+        # Opens keep arriving after send; only count sends older than this
+        self.maturity_days = maturity_days
+        # --update re-counts this many trailing days to pick up late opens
+        self.reopen_days = reopen_days
+
+        self._reset_counts()
+
+    def _reset_counts(self):
+        self.industries = []
+        self.functions = []
+        self._industry_index = {}
+        self._function_index = {}
+
+        self.opens = np.zeros((0, 0, N_DAYS, N_HOURS), dtype=np.int32)
+        self.sends = np.zeros((0, 0, N_DAYS, N_HOURS), dtype=np.int32)
+        # None for artifacts saved before per-day counts were kept
+        self.daily = DAILY_EMPTY.copy()
+
+        self.last_sent_at = None
+        self._rates = None
+
+    def fetch_outcomes(self, since=None):
+        """Fetch matured email outcomes (the whole-day 180-day window, or sent on / after the date `since`)"""
+
+        conn = psycopg2.connect(**self.db_config)
+
+        if since is None:
+            window = f"eo.sent_at >= date_trunc('day', NOW()) - INTERVAL '{WINDOW_DAYS} days'"
+            params = [self.maturity_days]
+        else:
+            window = "eo.sent_at >= %s"
+            params = [since, self.maturity_days]
+
+        query = f"""
+        SELECT
+            eo.sent_at,
+            date_trunc('day', eo.sent_at)::date as sent_day,
+            EXTRACT(DOW FROM eo.sent_at) as day_of_week,
+            EXTRACT(HOUR FROM eo.sent_at) as hour_of_day,
+            CASE WHEN eo.opened THEN 1 ELSE 0 END as opened,
+            COALESCE(c.industry, 'unknown') as industry,
+            COALESCE(p.function, 'unknown') as function
+
+        FROM email_outcomes eo
+        LEFT JOIN companies c ON c.id = eo.company_id
+        LEFT JOIN people p ON p.id = eo.person_id
+
+        WHERE
+            {window}
+            AND eo.sent_at <= NOW() - make_interval(days => %s)
+            AND eo.delivered = TRUE
+        """
+
+        try:
+            df = pd.read_sql(query, conn, params=params)
+        except Exception as e:
+            print(f"Error fetching data: {e}")
+            df = pd.DataFrame()
+        finally:
+            conn.close()
+
+        return df
+
+    def _window_start_day(self):
+        """First day of the training window, in the database's calendar (days since epoch)"""
+
+        conn = psycopg2.connect(**self.db_config)
+
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT (date_trunc('day', NOW()) - INTERVAL '{WINDOW_DAYS} days')::date")
+            return int(epoch_days([cur.fetchone()[0]])[0])
+        finally:
+            conn.close()
+
+    def _index_of(self, values, vocab, index):
+        """Map category values to array indices, growing the vocabulary as needed"""
+
+        for value in pd.unique(values):
+            if value not in index:
+                index[value] = len(vocab)
+                vocab.append(value)
+
+        return pd.Series(values).map(index).to_numpy().astype(np.int64)
+
+    def _grow(self):
+        """Pad count arrays to the current vocabulary sizes"""
+
+        pad_i = max(len(self.industries) - self.opens.shape[0], 0)
+        pad_f = max(len(self.functions) - self.opens.shape[1], 0)
+
+        if pad_i or pad_f:
+            # Grow in chunks so a trickle of new categories doesn't copy every update
+            pad_i = max(pad_i, 8) if pad_i else 0
+            pad_f = max(pad_f, 8) if pad_f else 0
+            widths = ((0, pad_i), (0, pad_f), (0, 0), (0, 0))
+            self.opens = np.pad(self.opens, widths)
+            self.sends = np.pad(self.sends, widths)
+
+    def add_counts(self, df):
+        """Absorb email outcomes (sent_day, day_of_week, hour_of_day, industry, function, opened)"""
+
+        if len(df) == 0:
+            return 0
+
+        ind = self._index_of(df['industry'].to_numpy(), self.industries, self._industry_index)
+        fn = self._index_of(df['function'].to_numpy(), self.functions, self._function_index)
+        self._grow()
+
+        daily = pd.DataFrame({
+            'day': epoch_days(df['sent_day']),
+            'industry': ind,
+            'function': fn,
+            'day_of_week': df['day_of_week'].to_numpy().astype(np.int64),
+            'hour_of_day': df['hour_of_day'].to_numpy().astype(np.int64),
+            'opens': df['opened'].to_numpy().astype(np.int64),
+            'sends': 1
+        }).groupby(DAILY_KEYS, as_index=False).sum()
+
+        cell = tuple(daily[key].to_numpy() for key in DAILY_KEYS[1:])
+        np.add.at(self.opens, cell, daily['opens'].to_numpy().astype(np.int32))
+        np.add.at(self.sends, cell, daily['sends'].to_numpy().astype(np.int32))
+
+        if self.daily is not None:
+            self.daily = pd.concat([self.daily, daily], ignore_index=True)
+
+        if 'sent_at' in df.columns:
+            latest = pd.Timestamp(df['sent_at'].max())
+            if self.last_sent_at is None or latest > pd.Timestamp(self.last_sent_at):
+                self.last_sent_at = latest.isoformat()
+
+        self._rates = None
+        return len(df)
+
+    def _rebuild_counts(self):
+        """Recompute the count arrays from the per-day aggregates"""
+
+        shape = (len(self.industries), len(self.functions), N_DAYS, N_HOURS)
+        self.opens = np.zeros(shape, dtype=np.int32)
+        self.sends = np.zeros(shape, dtype=np.int32)
+
+        cell = tuple(self.daily[key].to_numpy() for key in DAILY_KEYS[1:])
+        np.add.at(self.opens, cell, self.daily['opens'].to_numpy().astype(np.int32))
+        np.add.at(self.sends, cell, self.daily['sends'].to_numpy().astype(np.int32))
+
+        self._rates = None
+
+    def rates(self):
+        """Posterior mean open rates: (slot, industry x slot, segment x slot)"""
+
+        if self._rates is not None:
+            return self._rates
+
+        n_i, n_f = len(self.industries), len(self.functions)
+        opens = self.opens[:n_i, :n_f].astype(np.float64)
+        sends = self.sends[:n_i, :n_f].astype(np.float64)
+
+        a, b = self.global_prior
+        overall = (opens.sum() + a) / (sends.sum() + a + b)
+
+        k = self.slot_strength
+        slot = (opens.sum(axis=(0, 1)) + k * overall) / (sends.sum(axis=(0, 1)) + k)
+
+        k = self.industry_strength
+        industry = (opens.sum(axis=1) + k * slot) / (sends.sum(axis=1) + k)
+
+        k = self.segment_strength
+        segment = (opens + k * industry[:, None]) / (sends + k)
+
+        self._rates = (slot, industry, segment)
+        return self._rates
+
+    def predict_open_rates(self, slots_df):
+        """Predict open rate for each (day_of_week, hour_of_day, industry, function) row"""
+
+        slot, industry, segment = self.rates()
+
+        d = slots_df['day_of_week'].to_numpy().astype(np.int64)
+        h = slots_df['hour_of_day'].to_numpy().astype(np.int64)
+        ind = slots_df['industry'].map(self._industry_index).fillna(-1).to_numpy().astype(np.int64)
+        fn = slots_df['function'].map(self._function_index).fillna(-1).to_numpy().astype(np.int64)
+
+        # Unseen industry -> slot level; unseen function -> industry level
+        predictions = slot[d, h].copy()
+
+        known = ind >= 0
+        predictions[known] = industry[ind[known], d[known], h[known]]
+
+        known &= fn >= 0
+        predictions[known] = segment[ind[known], fn[known], d[known], h[known]]
+
+        return predictions
+
+    def predict_best_time(self, company_industry, person_function):
+        """Predict best send time for a specific recipient"""
+
+        if self.sends.size == 0:
+            model_path = self._model_path()
+
+            if not os.path.exists(model_path):
+                # Return default best time: Tuesday 10 AM
+                return {
+                    'day_of_week': 2,
+                    'hour_of_day': 10,
+                    'predicted_open_rate': 0.3
+                }
+
+            self.load(model_path)
+
+        # Same business-hours grid as SendTimeOptimizer
+        days, hours = np.meshgrid(np.arange(N_DAYS), np.arange(7, 19), indexing='ij')
+        slots = pd.DataFrame({
+            'day_of_week': days.ravel(),
+            'hour_of_day': hours.ravel(),
+            'industry': company_industry,
+            'function': person_function
+        })
+
+        predictions = self.predict_open_rates(slots)
+        best_idx = np.argmax(predictions)
+
+        return {
+            'day_of_week': int(slots['day_of_week'].iloc[best_idx]),
+            'hour_of_day': int(slots['hour_of_day'].iloc[best_idx]),
+            'predicted_open_rate': float(predictions[best_idx])
+        }
+
+    def train(self):
+        """Rebuild counts from the full 180-day window"""
+
+        print("Fetching send time data...")
+        df = self.fetch_outcomes()
+
+        start = time.perf_counter()
+        self._reset_counts()
+        self.add_counts(df)
+        train_ms = (time.perf_counter() - start) * 1000
+
+        print(f"✅ Beta-Binomial estimator built from {len(df)} email sends in {train_ms:.1f}ms "
+              f"({len(self.industries)} industries × {len(self.functions)} functions)")
+
+        model_path = self.save()
+        self._register_model(model_path, train_ms, len(df))
+
+    def update(self):
+        """
+        Bring the saved counts up to date with the 180-day window: drop days
+        that left it, and re-count the trailing reopen_days days plus
+        everything newer (late opens on already-absorbed sends included)
+        """
+
+        model_path = self._model_path()
+        if not os.path.exists(model_path):
+            print("⚠️  No saved estimator found - running full train")
+            self.train()
+            return
+
+        self.load(model_path)
+
+        if self.daily is None:
+            print("⚠️  Saved estimator has no per-day counts - running full train")
+            self.train()
+            return
+
+        window_start = self._window_start_day()
+        refresh_from = window_start
+        if len(self.daily):
+            refresh_from = max(window_start, int(self.daily['day'].max()) - self.reopen_days)
+
+        df = self.fetch_outcomes(since=np.datetime64(refresh_from, 'D').astype(object))
+
+        start = time.perf_counter()
+        days = self.daily['day']
+        expired = int((days < window_start).sum())
+        self.daily = self.daily[(days >= window_start) & (days < refresh_from)]
+        added = self.add_counts(df)
+        self._rebuild_counts()
+        update_ms = (time.perf_counter() - start) * 1000
+
+        self.save()
+        print(f"✅ Re-counted {added} email sends since {np.datetime64(refresh_from, 'D')} and dropped "
+              f"{expired} expired day-cells in {update_ms:.1f}ms")
+
+    def benchmark(self, df, holdout_days=30):
+        """Compare against the RandomForest optimizer on a held-out trailing period"""
+
+        cutoff = df['sent_at'].max() - timedelta(days=holdout_days)
+        train_df = df[df['sent_at'] <= cutoff]
+        test_df = df[df['sent_at'] > cutoff]
+
+        print(f"Benchmark: {len(train_df)} training sends, {len(test_df)} held-out sends "
+              f"(last {holdout_days} days)")
+
+        y = test_df['opened'].to_numpy().astype(np.float64)
+        results = {}
+
+        rf = SendTimeOptimizer(self.db_config)
+        start = time.perf_counter()
+        mae = rf.fit(train_df)
+        rf_train_ms = (time.perf_counter() - start) * 1000
+
+        if mae is not None:
+            results['random_forest'] = self._score(y, rf.predict_open_rates(test_df))
+            results['random_forest']['train_ms'] = rf_train_ms
+
+        estimator = BetaBinomialSendTimeEstimator(
+            self.db_config, self.global_prior, self.slot_strength,
+            self.industry_strength, self.segment_strength, self.maturity_days, self.reopen_days
+        )
+        start = time.perf_counter()
+        estimator.add_counts(train_df)
+        bb_train_ms = (time.perf_counter() - start) * 1000
+
+        results['beta_binomial'] = self._score(y, estimator.predict_open_rates(test_df))
+        results['beta_binomial']['train_ms'] = bb_train_ms
+
+        # Cost of absorbing the held-out period incrementally
+        start = time.perf_counter()
+        estimator.add_counts(test_df)
+        results['beta_binomial']['update_ms'] = (time.perf_counter() - start) * 1000
+
+        return results
+
+    def _score(self, y, predictions):
+        """Per-send Brier score, log loss and AUC of predicted open rates"""
+
+        from sklearn.metrics import roc_auc_score
+
+        p = np.clip(predictions, 1e-6, 1 - 1e-6)
+
+        return {
+            'brier': float(np.mean((p - y) ** 2)),
+            'log_loss': float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))),
+            'auc': float(roc_auc_score(y, p)) if 0 < y.sum() < len(y) else None
+        }
+
+    def _model_path(self):
+        model_dir = trained_models_dir()
+        return os.path.join(model_dir, 'send_time_beta_binomial.npz')
+
+    def save(self, model_path=None):
+        model_path = model_path or self._model_path()
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+
+        n_i, n_f = len(self.industries), len(self.functions)
+        daily = self.daily if self.daily is not None else DAILY_EMPTY
+        np.savez_compressed(
+            model_path,
+            opens=self.opens[:n_i, :n_f],
+            sends=self.sends[:n_i, :n_f],
+            industries=np.array(self.industries, dtype=str),
+            functions=np.array(self.functions, dtype=str),
+            **{f'daily_{column}': daily[column].to_numpy(dtype=np.int32) for column in daily.columns},
+            meta=np.array(json.dumps({
+                'global_prior': list(self.global_prior),
+                'slot_strength': self.slot_strength,
+                'industry_strength': self.industry_strength,
+                'segment_strength': self.segment_strength,
+                'maturity_days': self.maturity_days,
+                'reopen_days': self.reopen_days,
+                'last_sent_at': self.last_sent_at
+            }))
+        )
+
+        print(f"Model saved to {model_path}")
+        return model_path
+
+    def load(self, model_path=None):
+        with np.load(model_path or self._model_path()) as data:
+            self.opens = data['opens']
+            self.sends = data['sends']
+            self.industries = data['industries'].tolist()
+            self.functions = data['functions'].tolist()
+            meta = json.loads(str(data['meta']))
+            self.daily = pd.DataFrame({
+                column: data[f'daily_{column}'].astype(np.int64) for column in DAILY_EMPTY.columns
+            }) if 'daily_day' in data.files else None
+
+        self._industry_index = {v: i for i, v in enumerate(self.industries)}
+        self._function_index = {v: i for i, v in enumerate(self.functions)}
+
+        self.global_prior = tuple(meta['global_prior'])
+        self.slot_strength = meta['slot_strength']
+        self.industry_strength = meta['industry_strength']
+        self.segment_strength = meta['segment_strength']
+        self.maturity_days = meta.get('maturity_days', self.maturity_days)
+        self.reopen_days = meta.get('reopen_days', self.reopen_days)
+        self.last_sent_at = meta['last_sent_at']
+        self._rates = None
+
+    def _register_model(self, model_path, train_ms, training_samples):
+        """Register trained model in database"""
+
+        try:
+            conn = psycopg2.connect(**self.db_config)
+            cur = conn.cursor()
+
+            cur.execute("""
+                INSERT INTO ml_models (
+                    model_name, model_version, model_type, model_path,
+                    feature_columns, metrics, status, deployed_at, training_samples
+                ) VALUES (
+                    'send_time_beta_binomial',
+                    %s,
+                    'beta_binomial',
+                    %s,
+                    %s,
+                    %s,
+                    'deployed',
+                    NOW(),
+                    %s
+                )
+            """, [
+                datetime.now().strftime('%Y%m%d'),
+                model_path,
+                json.dumps(['day_of_week', 'hour_of_day', 'industry', 'function']),
+                json.dumps({'train_ms': train_ms, 'segments': len(self.industries) * len(self.functions)}),
+                training_samples
+            ])
+
+            conn.commit()
+            cur.close()
+            conn.close()
+
+            print(f"✅ Model registered in database")
+        except Exception as e:
+            print(f"⚠️  Failed to register model in database: {e}")
+
+# Training/prediction script
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--predict', type=str, help='JSON input for prediction')
+    parser.add_argument('--update', action='store_true', help='Absorb new outcomes into the saved counts')
+    parser.add_argument('--benchmark', action='store_true', help='Compare against the RandomForest optimizer')
+    parser.add_argument('--holdout-days', type=int, default=30, help='Held-out trailing period for --benchmark')
+    args = parser.parse_args()
+
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'database': os.getenv('DB_NAME', 'upr'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '')
+    }
+
+    estimator = BetaBinomialSendTimeEstimator(db_config)
+
+    if args.predict:
+        # Prediction mode
+        input_data = json.loads(args.predict)
+        result = estimator.predict_best_time(
+            input_data.get('industry', 'unknown'),
+            input_data.get('function', 'unknown')
+        )
+        print(json.dumps(result))
+
+    elif args.benchmark:
+        df = estimator.fetch_outcomes()
+        if len(df) < 100:
+            print(f"⚠️  Insufficient data for benchmark ({len(df)} samples)")
+            sys.exit(1)
+
+        print(json.dumps(estimator.benchmark(df, args.holdout_days), indent=2))
+
+    else:
+        try:
+            if args.update:
+                estimator.update()
+            else:
+                estimator.train()
+                print(f"\n✅ Beta-Binomial send time estimator training complete!")
+        except Exception as e:
+            print(f"\n❌ Training failed: {e}")
+            import traceback
+            traceback.print_exc()
+            sys.exit(1)
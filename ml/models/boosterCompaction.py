@@ -0,0 +1,166 @@
+"""
+Booster Compaction
+
+Post-training step for the conversion model. The trained booster (the
+teacher) is compared against smaller candidates:
+
+    truncated   the teacher's first N trees (booster slice, same depth)
+    distilled   a shallower, shorter student fit with XGBoost on the
+                teacher's probabilities (soft labels) for the training rows
+
+Every candidate is scored against the true labels of a validation split
+carved from the training data (not the test split). The smallest one
+whose validation AUC is within the tolerance of the teacher's is deployed
+(the teacher itself always qualifies). The caller reports the deployed
+model's AUC on its untouched test split, since the validation AUC of the
+chosen candidate is biased upwards by the selection. All candidates come
+back as XGBClassifier, so loading, predict_proba and feature_importances_
+work unchanged for the predictors.
+"""
+
+import pickle
+import statistics
+import time
+
+import xgboost as xgb
+from xgboost import XGBClassifier
+from sklearn.metrics import roc_auc_score
+
+from resourceGovernor import thread_budget
+
+DEFAULT_AUC_TOLERANCE = 0.005
+
+# Tree counts tried as teacher prefixes
+TRUNCATION_TREES = (25, 50, 100, 150)
+
+# (n_estimators, max_depth) of the distilled students
+STUDENT_CONFIGS = ((50, 3), (100, 3), (100, 4), (50, 4))
+STUDENT_LEARNING_RATE = 0.2
+
+
+def _as_classifier(booster):
+    model = XGBClassifier()
+    model.load_model(bytearray(booster.save_raw()))
+    return model.set_params(n_jobs=thread_budget())
+
+
+def truncate_booster(model, n_trees):
+    """XGBClassifier holding the first n_trees boosting rounds of model"""
+
+    return _as_classifier(model.get_booster()[:n_trees])
+
+
+def distill_student(teacher, X, sample_weight=None, n_estimators=50, max_depth=3,
+                    learning_rate=STUDENT_LEARNING_RATE):
+    """Fit a smaller booster to the teacher's probabilities on X (log loss on soft labels)"""
+
+    soft_labels = teacher.predict_proba(X)[:, 1]
+
+    booster = xgb.train(
+        {
+            'objective': 'binary:logistic',
+            'max_depth': max_depth,
+            'eta': learning_rate,
+            'seed': 42,
+            'nthread': thread_budget()
+        },
+        xgb.DMatrix(X, label=soft_labels, weight=sample_weight, nthread=thread_budget()),
+        num_boost_round=n_estimators
+    )
+
+    return _as_classifier(booster)
+
+
+def model_size_bytes(model):
+    """Pickled size, i.e. what the artifact costs to store and load"""
+
+    return len(pickle.dumps(model))
+
+
+def predict_latency_ms(model, X, repeats=30):
+    """Median predict_proba time for one row and for the whole frame"""
+
+    single_row = X.iloc[:1]
+    model.predict_proba(single_row)
+
+    single, batch = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(single_row)
+        single.append((time.perf_counter() - start) * 1000)
+
+    for _ in range(max(3, repeats // 10)):
+        start = time.perf_counter()
+        model.predict_proba(X)
+        batch.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'single_row_ms': round(statistics.median(single), 4),
+        'batch_ms': round(statistics.median(batch), 3),
+        'batch_rows': int(len(X))
+    }
+
+
+def _describe(kind, model, max_depth, X_val, y_val, w_val):
+    proba = model.predict_proba(X_val)[:, 1]
+
+    return {
+        'kind': kind,
+        'trees': int(model.get_booster().num_boosted_rounds()),
+        'max_depth': max_depth,
+        'validation_auc_roc': float(roc_auc_score(y_val, proba, sample_weight=w_val)),
+        'size_bytes': model_size_bytes(model),
+        **predict_latency_ms(model, X_val)
+    }
+
+
+def compact_booster(teacher, X_train, w_train, X_val, y_val, w_val=None,
+                    auc_tolerance=DEFAULT_AUC_TOLERANCE):
+    """
+    Returns (model to deploy, report). X_train is what the teacher was fit
+    on (students are distilled on it); X_val must be held out from both the
+    fit and the final test split. The report lists every candidate and the
+    deployed model's size and latency savings relative to the teacher.
+    """
+
+    n_trees = teacher.get_booster().num_boosted_rounds()
+    teacher_depth = teacher.get_params().get('max_depth')
+
+    # name -> (model, max_depth)
+    candidates = {'teacher': (teacher, teacher_depth)}
+    for n in TRUNCATION_TREES:
+        if n < n_trees:
+            candidates[f'truncated_{n}'] = (truncate_booster(teacher, n), teacher_depth)
+    for n, depth in STUDENT_CONFIGS:
+        candidates[f'distilled_{n}x{depth}'] = (distill_student(teacher, X_train, w_train, n, depth), depth)
+
+    described = {}
+    for name, (model, max_depth) in candidates.items():
+        described[name] = _describe(name.split('_')[0], model, max_depth, X_val, y_val, w_val)
+        print(f"   {name:<16} val AUC {described[name]['validation_auc_roc']:.4f}  "
+              f"{described[name]['size_bytes'] / 1024:8.1f} KB  "
+              f"{described[name]['single_row_ms']:.3f} ms/row")
+
+    teacher_auc = described['teacher']['validation_auc_roc']
+    eligible = [name for name in candidates if teacher_auc - described[name]['validation_auc_roc'] <= auc_tolerance]
+    chosen = min(eligible, key=lambda name: (described[name]['size_bytes'], described[name]['single_row_ms']))
+
+    deployed, base = described[chosen], described['teacher']
+
+    report = {
+        'auc_tolerance': auc_tolerance,
+        'deployed': chosen,
+        'teacher_validation_auc_roc': teacher_auc,
+        'validation_auc_roc': deployed['validation_auc_roc'],
+        'size_bytes': deployed['size_bytes'],
+        'teacher_size_bytes': base['size_bytes'],
+        'size_reduction': round(1 - deployed['size_bytes'] / base['size_bytes'], 4),
+        'single_row_ms': deployed['single_row_ms'],
+        'teacher_single_row_ms': base['single_row_ms'],
+        'batch_speedup': round(base['batch_ms'] / deployed['batch_ms'], 2) if deployed['batch_ms'] else None,
+        'single_row_speedup': round(base['single_row_ms'] / deployed['single_row_ms'], 2)
+        if deployed['single_row_ms'] else None,
+        'candidates': described
+    }
+
+    return candidates[chosen][0], report
@@ -10,28 +10,101 @@ import pandas as pd
 import numpy as np
 from xgboost import XGBClassifier
 from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.metrics import roc_auc_score, classification_report
+from sklearn.metrics import roc_auc_score, classification_report, brier_score_loss, log_loss
 import joblib
 import json
 import psycopg2
 from datetime import datetime
 import os
 import sys
+import time
 import argparse
 
+from modelPaths import trained_models_dir
+from tenantScope import normalize_tenant_id, tenant_outcomes_filter
+from trainingFingerprint import check_training_fingerprint, default_min_new_rows
+from trainingFeatures import FEATURE_TABLE, feature_table_enabled, benchmark_queries
+from resourceGovernor import get_governor, thread_budget, limit_model_threads
+from outputFormat import OUTPUT_FORMATS, PYARROW_AVAILABLE, read_predict_input, write_arrow
+from boosterCompaction import DEFAULT_AUC_TOLERANCE, compact_booster
+from featureSchema import encode_features
+
+# Rows used for training (alias eo); also fingerprinted to skip redundant retrains.
+# Whole days, so the window (and its fingerprint) only moves once a day
+TRAINING_WINDOW_SQL = """
+            eo.sent_at >= date_trunc('day', NOW()) - INTERVAL '180 days'
+            AND eo.sent_at < date_trunc('day', NOW()) - INTERVAL '7 days'
+            AND eo.delivered = TRUE
+"""
+
 class ConversionPredictor:
 
-    def __init__(self, db_config):
+    def __init__(self, db_config, tenant_id=None, use_feature_table=None):
         self.db_config = db_config
+        self.tenant_id = normalize_tenant_id(tenant_id)  # None = global model
+        # Read the flattened ml_training_features table instead of feature_store
+        self.use_feature_table = feature_table_enabled() if use_feature_table is None else use_feature_table
         self.model = None
         self.feature_columns = None
+        self.data_fingerprint = None
+        self.training_metrics = {}  # extra metrics recorded in ml_models.metrics
 
-    def fetch_training_data(self):
-        """Fetch features + labels from database"""
+    def _training_window(self):
+        return TRAINING_WINDOW_SQL + tenant_outcomes_filter(self.tenant_id)
 
-        conn = psycopg2.connect(**self.db_config)
+    def training_query(self, negative_sample_rate=None, use_feature_table=None):
+        """
+        SQL for the training rows (see fetch_training_data)
+
+        With negative_sample_rate (0 < rate < 1), every conversion is kept and
+        non-converting rows are kept with that probability, decided in SQL by
+        a hash of the outcome id (deterministic across runs) so dropped rows
+        never leave the DB. A sample_weight column (1 / rate for negatives)
+        is returned to undo the sampling during fit.
+        """
 
-        query = """
+        sampling_columns = ''
+        sampling_filter = ''
+
+        if negative_sample_rate is not None:
+            rate = float(negative_sample_rate)
+            if not 0 < rate <= 1:
+                raise ValueError(f"negative_sample_rate must be in (0, 1], got {negative_sample_rate}")
+
+            # hashtext() is int4; shift to [0, 2^32) and keep the lowest `rate` share
+            sampling_columns = f"""
+            -- Importance weight undoing negative downsampling
+            CASE WHEN eo.converted THEN 1.0 ELSE {1 / rate!r} END as sample_weight,
+"""
+            sampling_filter = f"""
+            AND (eo.converted OR hashtext(eo.id::text)::bigint + 2147483648 < {int(rate * 2 ** 32)})
+"""
+
+        if use_feature_table is None:
+            use_feature_table = self.use_feature_table
+
+        if use_feature_table:
+            # Same columns, already extracted and typed by the triggers (newest feature
+            # version per entity, malformed numerics defaulted; see trainingFeatures)
+            return f"""
+        SELECT
+            industry, size_bucket, uae_presence, account_age_days, active_days_90d,
+            emails_sent_total, company_open_rate, company_reply_rate,
+            function, seniority_level, person_emails_received, person_open_rate,
+            subject_length, body_word_count, personalization_level, readability_score,
+            has_cta, spam_words_count,
+            send_hour, send_day_of_week,
+
+            {sampling_columns}
+            eo.converted as label
+
+        FROM {FEATURE_TABLE} eo
+
+        WHERE {self._training_window()}
+            {sampling_filter}
+        """
+
+        return f"""
         SELECT
             -- Company features (from feature_store)
             COALESCE((fs_company.features->>'industry')::text, 'unknown') as industry,
@@ -61,6 +134,7 @@ class ConversionPredictor:
             EXTRACT(HOUR FROM eo.sent_at) as send_hour,
             EXTRACT(DOW FROM eo.sent_at) as send_day_of_week,
 
+            {sampling_columns}
             -- Target variable
             eo.converted as label
 
@@ -69,12 +143,17 @@ class ConversionPredictor:
         LEFT JOIN feature_store fs_person ON fs_person.entity_type = 'person' AND fs_person.entity_id = eo.person_id
         LEFT JOIN feature_store fs_email ON fs_email.entity_type = 'email' AND fs_email.entity_id = eo.id
 
-        WHERE
-            eo.sent_at > NOW() - INTERVAL '180 days'
-            AND eo.sent_at < NOW() - INTERVAL '7 days'
-            AND eo.delivered = TRUE
+        WHERE {self._training_window()}
+            {sampling_filter}
         """
 
+    def fetch_training_data(self, negative_sample_rate=None, use_feature_table=None):
+        """Fetch features + labels from database (use_feature_table=None follows self.use_feature_table)"""
+
+        query = self.training_query(negative_sample_rate, use_feature_table)
+
+        conn = psycopg2.connect(**self.db_config)
+
         try:
             df = pd.read_sql(query, conn)
         except Exception as e:
@@ -86,11 +165,48 @@ class ConversionPredictor:
 
         return df
 
-    def train(self):
-        """Train the model"""
+    def _build_model(self, pos_weight):
+        return XGBClassifier(
+            n_estimators=200,
+            max_depth=6,
+            learning_rate=0.1,
+            subsample=0.8,
+            colsample_bytree=0.8,
+            scale_pos_weight=pos_weight,
+            random_state=42,
+            eval_metric='logloss',
+            n_jobs=thread_budget()
+        )
+
+    def train(self, force=False, min_new_rows=0, negative_sample_rate=None, compact_tolerance=None):
+        """
+        Train the model (returns None when skipped because the training data is unchanged)
+
+        With compact_tolerance, the trained booster is compacted afterwards
+        (see boosterCompaction): the smallest truncated or distilled model
+        whose AUC on a validation split (carved from the training rows, so
+        the teacher is fit on the rest) is within that tolerance is saved
+        instead. The AUC returned and registered is the deployed model's on
+        the untouched test split; size / latency savings go into
+        ml_models.metrics.
+        """
+
+        if not force:
+            skip, reason, self.data_fingerprint = check_training_fingerprint(
+                self.db_config, 'conversion_predictor', self._training_window(), min_new_rows,
+                tenant_id=self.tenant_id,
+                params={'negative_sample_rate': negative_sample_rate, 'compact_tolerance': compact_tolerance},
+                label_columns=('converted',)
+            )
 
-        print("Fetching training data...")
-        df = self.fetch_training_data()
+            if skip:
+                print(f"⏭️  Skipping conversion_predictor training: {reason}")
+                return None
+
+            print(f"Training data fingerprint: {reason}")
+
+        print(f"Fetching training data{f' for tenant {self.tenant_id}' if self.tenant_id else ''}...")
+        df = self.fetch_training_data(negative_sample_rate)
 
         if len(df) < 100:
             print(f"⚠️  Insufficient training data ({len(df)} samples). Need at least 100 samples.")
@@ -98,8 +214,15 @@ class ConversionPredictor:
             self._create_dummy_model()
             return 0.5
 
+        # Importance weights (all 1 without negative sampling)
+        weights = df.pop('sample_weight').astype(float) if 'sample_weight' in df.columns \
+            else pd.Series(1.0, index=df.index)
+
         print(f"Training on {len(df)} samples")
-        print(f"Conversion rate: {df['label'].mean():.2%}")
+        print(f"🧮 {get_governor().summary()}")
+        if negative_sample_rate is not None:
+            print(f"Negative sample rate: {negative_sample_rate} (weighted size {weights.sum():.0f})")
+        print(f"Conversion rate: {np.average(df['label'], weights=weights):.2%}")
 
         # Separate features and labels
         X = df.drop(columns=['label'])
@@ -111,39 +234,44 @@ class ConversionPredictor:
         self.feature_columns = X.columns.tolist()
 
         # Split
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y if y.sum() > 1 else None
+        X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+            X, y, weights, test_size=0.2, random_state=42, stratify=y if y.sum() > 1 else None
         )
 
+        # Compaction picks its candidate on a validation split of the training
+        # rows, so the test split stays unbiased for the deployed model
+        X_fit, y_fit, w_fit = X_train, y_train, w_train
+        if compact_tolerance is not None:
+            X_fit, X_val, y_fit, y_val, w_fit, w_val = train_test_split(
+                X_train, y_train, w_train, test_size=0.2, random_state=42,
+                stratify=y_train if y_train.sum() > 1 else None
+            )
+
         # Train XGBoost
         print("Training XGBoost model...")
 
-        # Calculate scale_pos_weight for class imbalance
-        pos_weight = (len(y_train) - y_train.sum()) / max(y_train.sum(), 1)
+        if negative_sample_rate is None:
+            # Calculate scale_pos_weight for class imbalance
+            pos_weight = (len(y_fit) - y_fit.sum()) / max(y_fit.sum(), 1)
+        else:
+            # Downsampling already rebalances the rows; the importance weights
+            # restore the true base rate, so probabilities stay calibrated
+            pos_weight = 1.0
 
-        self.model = XGBClassifier(
-            n_estimators=200,
-            max_depth=6,
-            learning_rate=0.1,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            scale_pos_weight=pos_weight,
-            random_state=42,
-            eval_metric='logloss'
-        )
-
-        self.model.fit(X_train, y_train)
+        self.model = self._build_model(pos_weight)
+        self.model.fit(X_fit, y_fit, sample_weight=w_fit)
 
         # Evaluate
         y_pred = self.model.predict(X_test)
         y_pred_proba = self.model.predict_proba(X_test)[:, 1]
 
-        auc = roc_auc_score(y_test, y_pred_proba)
+        auc = roc_auc_score(y_test, y_pred_proba, sample_weight=w_test)
+        self.training_metrics['negative_sample_rate'] = negative_sample_rate
 
         print(f"\nModel Performance:")
         print(f"AUC-ROC: {auc:.4f}")
         print("\nClassification Report:")
-        print(classification_report(y_test, y_pred))
+        print(classification_report(y_test, y_pred, sample_weight=w_test))
 
         # Feature importance
         feature_importance = pd.DataFrame({
@@ -154,8 +282,25 @@ class ConversionPredictor:
         print("\nTop 20 Features:")
         print(feature_importance.to_string(index=False))
 
+        if compact_tolerance is not None:
+            print(f"\n🗜️  Compacting booster (AUC tolerance {compact_tolerance})...")
+            self.model, compaction = compact_booster(
+                self.model, X_fit, w_fit, X_val, y_val, w_val, compact_tolerance
+            )
+
+            # Test AUC of what is actually deployed (teacher's is `auc` above)
+            compaction['teacher_auc_roc'] = auc
+            auc = roc_auc_score(y_test, self.model.predict_proba(X_test)[:, 1], sample_weight=w_test)
+            compaction['auc_roc'] = auc
+            self.training_metrics['compaction'] = compaction
+
+            print(f"Deploying {compaction['deployed']}: test AUC {auc:.4f} "
+                  f"(teacher {compaction['teacher_auc_roc']:.4f}), "
+                  f"{compaction['size_reduction']:.0%} smaller, "
+                  f"{compaction['single_row_speedup']}x single-row / {compaction['batch_speedup']}x batch speed")
+
         # Save model
-        model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
+        model_dir = trained_models_dir(self.tenant_id)
         os.makedirs(model_dir, exist_ok=True)
 
         model_path = os.path.join(model_dir, f"conversion_predictor_v{datetime.now().strftime('%Y%m%d')}.pkl")
@@ -172,6 +317,98 @@ class ConversionPredictor:
 
         return auc
 
+    def sampling_report(self, rates=(0.05, 0.1, 0.25)):
+        """
+        Compare negative-downsampled training against full-data training
+
+        Every variant is fit on the training split of one full pull and scored
+        on the same held-out split. Downsampling is emulated on that split with
+        the SQL rule (all positives, `rate` of negatives); the SQL-sampled
+        fetch itself is run separately to time it and count rows.
+        """
+
+        start = time.perf_counter()
+        df = self.fetch_training_data()
+        full_fetch_s = time.perf_counter() - start
+
+        if len(df) < 100:
+            return {'error': f'Insufficient training data ({len(df)} samples)'}
+
+        X = pd.get_dummies(df.drop(columns=['label']), drop_first=True)
+        y = df['label'].astype(int).to_numpy()
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y if y.sum() > 1 else None
+        )
+
+        def evaluate(X_fit, y_fit, w_fit, pos_weight, fetch_rows, fetch_s):
+            model = self._build_model(pos_weight)
+
+            start = time.perf_counter()
+            model.fit(X_fit, y_fit, sample_weight=w_fit)
+            fit_s = time.perf_counter() - start
+
+            proba = model.predict_proba(X_test)[:, 1]
+
+            # Expected calibration error over 10 equal-width bins
+            bins = np.minimum((proba * 10).astype(int), 9)
+            ece = sum(
+                abs(proba[bins == b].mean() - y_test[bins == b].mean()) * (bins == b).mean()
+                for b in range(10) if (bins == b).any()
+            )
+
+            return {
+                'rows_fetched': int(fetch_rows),
+                'fetch_s': round(fetch_s, 3),
+                'fit_rows': int(len(y_fit)),
+                'fit_s': round(fit_s, 3),
+                'auc_roc': float(roc_auc_score(y_test, proba)) if 0 < y_test.sum() < len(y_test) else None,
+                'brier': float(brier_score_loss(y_test, proba)),
+                'log_loss': float(log_loss(y_test, proba, labels=[0, 1])),
+                'ece': float(ece),
+                'mean_predicted': float(proba.mean()),
+                'observed_rate': float(y_test.mean())
+            }
+
+        report = {
+            'test_rows': int(len(y_test)),
+            'full': evaluate(
+                X_train, y_train, np.ones(len(y_train)),
+                (y_train == 0).sum() / max(y_train.sum(), 1), len(df), full_fetch_s
+            )
+        }
+
+        rng = np.random.default_rng(42)
+        u = rng.random(len(y_train))
+
+        for rate in rates:
+            start = time.perf_counter()
+            sampled_rows = len(self.fetch_training_data(rate))
+            fetch_s = time.perf_counter() - start
+
+            keep = (y_train == 1) | (u < rate)
+            X_fit, y_fit = X_train[keep], y_train[keep]
+
+            report[f'sampled_{rate}'] = evaluate(
+                X_fit, y_fit, np.where(y_fit == 1, 1.0, 1 / rate), 1.0, sampled_rows, fetch_s
+            )
+            # Same rows fit like full data (scale_pos_weight, no importance
+            # weights), to show what the weights correct
+            report[f'sampled_{rate}_unweighted'] = evaluate(
+                X_fit, y_fit, np.ones(len(y_fit)),
+                (y_fit == 0).sum() / max(y_fit.sum(), 1), sampled_rows, fetch_s
+            )
+
+        return report
+
+    def benchmark_fetch(self, repeats=5, negative_sample_rate=None):
+        """Time the training query against feature_store (JSONB joins) vs the flattened table"""
+
+        return benchmark_queries(self.db_config, {
+            'feature_store_joins': self.training_query(negative_sample_rate, use_feature_table=False),
+            'feature_table': self.training_query(negative_sample_rate, use_feature_table=True)
+        }, repeats)
+
     def _create_dummy_model(self):
         """Create a dummy model when insufficient data"""
         from sklearn.dummy import DummyClassifier
@@ -182,7 +419,7 @@ class ConversionPredictor:
         # Fit on dummy data
         self.model.fit([[0]], [0])
 
-        model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
+        model_dir = trained_models_dir(self.tenant_id)
         os.makedirs(model_dir, exist_ok=True)
 
         model_path = os.path.join(model_dir, f"conversion_predictor_dummy.pkl")
@@ -195,30 +432,100 @@ class ConversionPredictor:
         print(f"Dummy model saved to {model_path}")
         self._register_model(model_path, 0.5, 0)
 
+    @staticmethod
+    def latest_model_path(tenant_id=None):
+        """Latest conversion model artifact for a tenant (or the global model); None if absent"""
+
+        model_dir = trained_models_dir(tenant_id)
+        model_files = [f for f in os.listdir(model_dir) if f.startswith('conversion_predictor')] \
+            if os.path.isdir(model_dir) else []
+
+        return os.path.join(model_dir, sorted(model_files)[-1]) if model_files else None
+
+    def load_model(self, model_path=None, fallback_to_global=True, mmap_mode=None):
+        """Load a trained model (latest for this tenant, else the global one, if no path given)"""
+
+        if model_path is None:
+            model_path = self.latest_model_path(self.tenant_id)
+
+            if model_path is None and self.tenant_id and fallback_to_global:
+                model_path = self.latest_model_path(None)
+
+            if model_path is None:
+                raise FileNotFoundError('No trained model found')
+
+        loaded = joblib.load(model_path, mmap_mode=mmap_mode)
+        self.model = limit_model_threads(loaded['model'])
+        self.feature_columns = loaded['feature_columns']
+
+        return model_path
+
     def predict(self, features):
         """Predict conversion probability for new data"""
 
+        return self.predict_batch([features])[0]
+
+    def predict_batch(self, features_list):
+        """
+        Predict conversion probability for a list of feature dicts in one model
+        call. Rows are encoded independently (see featureSchema), so a row's
+        result does not depend on the others in the batch.
+        """
+
+        if not features_list:
+            return []
+
+        return self.predict_encoded(self._encode(features_list))
+
+    def predict_encoded(self, encoded_df):
+        """
+        predict_batch on a frame from featureSchema.encode_features. Columns
+        this model was not trained on are ignored, so one frame encoded
+        against several models' columns can be shared (see leadScorer).
+        """
+
+        columns = self.predict_columns_encoded(encoded_df)
+
+        return [
+            {
+                'probability': float(proba),
+                'confidence': float(confidence)
+            }
+            for proba, confidence in zip(columns['probability'], columns['confidence'])
+        ]
+
+    def predict_columns(self, features_list):
+        """predict_batch as {column: numpy array}, without building a dict per row"""
+
+        return self.predict_columns_encoded(self._encode(features_list))
+
+    def _encode(self, features_list):
         if self.model is None:
             raise ValueError("Model not trained. Call train() first.")
 
-        # Ensure features match training columns
-        features_df = pd.DataFrame([features])
-        features_df = pd.get_dummies(features_df)
+        return encode_features(features_list, self.feature_columns)
+
+    def predict_columns_encoded(self, encoded_df):
+        if self.model is None:
+            raise ValueError("Model not trained. Call train() first.")
 
-        # Add missing columns with 0
-        for col in self.feature_columns:
-            if col not in features_df.columns:
-                features_df[col] = 0
+        # Empty input: zero-length typed columns without calling the model
+        # (pandas cannot concatenate zero frames, older xgboost rejects 0 rows)
+        if len(encoded_df) == 0:
+            return {
+                'probability': np.empty(0, dtype=np.float32),
+                'confidence': np.empty(0, dtype=np.float32)
+            }
 
-        # Select only training columns in same order
-        features_df = features_df[self.feature_columns]
+        # Ensure features match training columns (missing columns filled with 0)
+        features_df = encoded_df.reindex(columns=self.feature_columns, fill_value=0)
 
         # Predict
-        proba = self.model.predict_proba(features_df)[0, 1]
+        probas = self.model.predict_proba(features_df)[:, 1]
 
         return {
-            'probability': float(proba),
-            'confidence': float(max(proba, 1 - proba))
+            'probability': probas,
+            'confidence': np.maximum(probas, 1 - probas)
         }
 
     def _register_model(self, model_path, auc, training_samples):
@@ -231,7 +538,7 @@ class ConversionPredictor:
             cur.execute("""
                 INSERT INTO ml_models (
                     model_name, model_version, model_type, model_path,
-                    feature_columns, metrics, status, deployed_at, training_samples
+                    feature_columns, metrics, status, deployed_at, training_samples, tenant_id
                 ) VALUES (
                     'conversion_predictor',
                     %s,
@@ -241,14 +548,16 @@ class ConversionPredictor:
                     %s,
                     'deployed',
                     NOW(),
+                    %s,
                     %s
                 )
             """, [
                 datetime.now().strftime('%Y%m%d'),
                 model_path,
                 json.dumps(self.feature_columns),
-                json.dumps({'auc_roc': auc}),
-                training_samples
+                json.dumps({'auc_roc': auc, 'data_fingerprint': self.data_fingerprint, **self.training_metrics}),
+                training_samples,
+                self.tenant_id
             ])
 
             conn.commit()
@@ -262,7 +571,27 @@ class ConversionPredictor:
 # Training script
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--predict', type=str, help='JSON features for prediction')
+    parser.add_argument('--predict', type=str,
+                        help='JSON features for prediction, or a list of them for a batch ("-" reads stdin)')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help='arrow: Arrow IPC stream of probability/confidence columns (needs pyarrow)')
+    parser.add_argument('--tenant', type=str, help='Train / predict with this tenant\'s model (default: global)')
+    parser.add_argument('--negative-sample-rate', type=float,
+                        default=float(os.environ['ML_NEGATIVE_SAMPLE_RATE']) if os.getenv('ML_NEGATIVE_SAMPLE_RATE') else None,
+                        help='Keep all conversions and this fraction of non-conversions (sampled in SQL, reweighted in fit)')
+    parser.add_argument('--sampling-report', type=str, nargs='?', const='0.05,0.1,0.25', metavar='RATES',
+                        help='Compare AUC, calibration and fit time of downsampled vs full-data training')
+    parser.add_argument('--force', action='store_true', help='Train even if the training data fingerprint is unchanged')
+    parser.add_argument('--min-new-rows', type=int, default=default_min_new_rows(),
+                        help='Skip training when fewer rows were added or changed since the deployed model')
+    parser.add_argument('--feature-table', action='store_true', default=feature_table_enabled(),
+                        help='Read features from the flattened ml_training_features table')
+    parser.add_argument('--compact', type=float, nargs='?', const=DEFAULT_AUC_TOLERANCE, metavar='AUC_TOLERANCE',
+                        default=float(os.environ['ML_COMPACT_AUC_TOLERANCE']) if os.getenv('ML_COMPACT_AUC_TOLERANCE') else None,
+                        help='After training, deploy the smallest truncated / distilled booster within this '
+                             'validation AUC of the full one (test AUC is reported for the deployed model)')
+    parser.add_argument('--benchmark-fetch', type=int, nargs='?', const=5, metavar='REPEATS',
+                        help='Compare training query time on feature_store joins vs the flattened table')
     args = parser.parse_args()
 
     db_config = {
@@ -273,35 +602,60 @@ if __name__ == '__main__':
         'password': os.getenv('DB_PASSWORD', '')
     }
 
-    predictor = ConversionPredictor(db_config)
+    predictor = ConversionPredictor(db_config, tenant_id=args.tenant, use_feature_table=args.feature_table)
 
     if args.predict:
         # Prediction mode
-        features = json.loads(args.predict)
+        if args.output_format == 'arrow' and not PYARROW_AVAILABLE:
+            print(json.dumps({'error': 'pyarrow is required for --output-format arrow'}))
+            sys.exit(1)
+
+        features = read_predict_input(args.predict)
 
         # Load latest model
-        model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
-        model_files = [f for f in os.listdir(model_dir) if f.startswith('conversion_predictor')]
+        try:
+            predictor.load_model()
+        except FileNotFoundError as e:
+            print(json.dumps({'error': str(e)}))
+            sys.exit(1)
 
-        if not model_files:
-            print(json.dumps({'error': 'No trained model found'}))
+        # Invalid features (see featureSchema.coerce_features) raise ValueError
+        try:
+            if args.output_format == 'arrow':
+                columns = predictor.predict_columns(features if isinstance(features, list) else [features])
+            elif isinstance(features, list):
+                result = predictor.predict_batch(features)
+            else:
+                result = predictor.predict(features)
+        except ValueError as e:
+            print(json.dumps({'error': str(e)}))
             sys.exit(1)
 
-        latest_model = sorted(model_files)[-1]
-        model_path = os.path.join(model_dir, latest_model)
+        if args.output_format == 'arrow':
+            write_arrow(columns)
+        else:
+            print(json.dumps(result))
 
-        loaded = joblib.load(model_path)
-        predictor.model = loaded['model']
-        predictor.feature_columns = loaded['feature_columns']
+    elif args.benchmark_fetch:
+        print(json.dumps(predictor.benchmark_fetch(args.benchmark_fetch, args.negative_sample_rate), indent=2))
 
-        result = predictor.predict(features)
-        print(json.dumps(result))
+    elif args.sampling_report:
+        rates = [float(r) for r in args.sampling_report.split(',')]
+        print(json.dumps(predictor.sampling_report(rates), indent=2))
 
     else:
         # Training mode
         try:
-            auc = predictor.train()
-            print(f"\n✅ Training complete! AUC: {auc:.4f}")
+            auc = predictor.train(
+                force=args.force,
+                min_new_rows=args.min_new_rows,
+                negative_sample_rate=args.negative_sample_rate,
+                compact_tolerance=args.compact
+            )
+            if auc is None:
+                print("\n✅ Training skipped - deployed model is current")
+            else:
+                print(f"\n✅ Training complete! AUC: {auc:.4f}")
         except Exception as e:
             print(f"\n❌ Training failed: {e}")
             import traceback
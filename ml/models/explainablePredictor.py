@@ -7,15 +7,22 @@ Users can see WHY a lead got a specific score
 
 import pandas as pd
 import numpy as np
-from xgboost import XGBClassifier
+from xgboost import XGBClassifier, DMatrix
 import joblib
 import json
 import psycopg2
+from collections import OrderedDict
 from datetime import datetime
 import os
 import sys
+import time
 import argparse
 
+from modelPaths import trained_models_dir
+from trainingFeatures import FEATURE_TABLE, feature_table_enabled
+from resourceGovernor import get_governor, thread_budget, limit_model_threads
+from featureSchema import encode_features
+
 # Try to import SHAP, but make it optional
 try:
     import shap
@@ -24,14 +31,31 @@ except ImportError:
     SHAP_AVAILABLE = False
     print("⚠️  SHAP not available. Install with: pip install shap")
 
+# Explanation tiers under a deadline, richest first. 'approximate' serves
+# each row a cached exact explanation when one exists, else a global-
+# importance one. Without SHAP, 'exact' uses XGBoost's built-in TreeSHAP.
+EXPLANATION_TIERS = ('exact', 'approximate', 'score')
+EXPLANATION_CACHE_SIZE = 10000
+LATENCY_EWMA_ALPHA = 0.2
+CALIBRATION_ROWS = 64
+
 class ExplainableConversionPredictor:
 
-    def __init__(self, db_config):
+    def __init__(self, db_config, use_feature_table=None):
         self.db_config = db_config
+        # Read the flattened ml_training_features table instead of feature_store
+        self.use_feature_table = feature_table_enabled() if use_feature_table is None else use_feature_table
         self.model = None
         self.explainer = None
         self.feature_columns = None
 
+        # Exact attributions by feature row, and per tier the fixed per-call
+        # cost and a running ms-per-row estimate (saved with the model at
+        # train time; older artifacts calibrate on the first deadline call)
+        self.explanation_cache = OrderedDict()
+        self.tier_overhead_ms = {}
+        self.tier_latency_ms = {}
+
     def train(self):
         """Train model and create SHAP explainer"""
 
@@ -43,6 +67,7 @@ class ExplainableConversionPredictor:
             return
 
         print(f"Training on {len(df)} samples")
+        print(f"🧮 {get_governor().summary()}")
 
         # Separate features and labels
         X = df.drop(columns=['label'])
@@ -64,20 +89,21 @@ class ExplainableConversionPredictor:
             colsample_bytree=0.8,
             scale_pos_weight=pos_weight,
             random_state=42,
-            eval_metric='logloss'
+            eval_metric='logloss',
+            n_jobs=thread_budget()
         )
 
         self.model.fit(X, y)
 
+        model_dir = trained_models_dir()
+        os.makedirs(model_dir, exist_ok=True)
+
         # Create SHAP explainer if available
         if SHAP_AVAILABLE:
             print("Creating SHAP explainer...")
             self.explainer = shap.TreeExplainer(self.model)
 
             # Save explainer
-            model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
-            os.makedirs(model_dir, exist_ok=True)
-
             explainer_path = os.path.join(model_dir, 'conversion_explainer.pkl')
             joblib.dump(self.explainer, explainer_path)
 
@@ -85,18 +111,81 @@ class ExplainableConversionPredictor:
         else:
             print("⚠️  SHAP not available - explanations will use feature importance fallback")
 
+        # Tier latency estimates ship with the model, so a process that loads
+        # it (e.g. one CLI call per prediction) never calibrates per call
+        self._reset_explanation_state()
+        self.calibrate_tiers()
+
         # Save model
         model_path = os.path.join(model_dir, 'conversion_predictor_explainable.pkl')
         joblib.dump({
             'model': self.model,
-            'feature_columns': self.feature_columns
+            'feature_columns': self.feature_columns,
+            'tier_overhead_ms': self.tier_overhead_ms,
+            'tier_latency_ms': self.tier_latency_ms
         }, model_path)
 
         print(f"✅ Model saved to {model_path}")
 
-    def predict_with_explanation(self, features):
+    def load_model(self):
+        """Load the explainable model (or the regular one) and its SHAP explainer"""
+
+        model_dir = trained_models_dir()
+        model_path = os.path.join(model_dir, 'conversion_predictor_explainable.pkl')
+
+        if not os.path.exists(model_path):
+            # Fall back to regular model
+            model_path = os.path.join(model_dir, 'conversion_predictor.pkl')
+
+        loaded = joblib.load(model_path)
+        self.model = limit_model_threads(loaded['model'])
+        self.feature_columns = loaded['feature_columns']
+
+        # Try to load explainer
+        if SHAP_AVAILABLE:
+            explainer_path = os.path.join(model_dir, 'conversion_explainer.pkl')
+            if os.path.exists(explainer_path):
+                self.explainer = joblib.load(explainer_path)
+
+        self._reset_explanation_state()
+        self.tier_overhead_ms = dict(loaded.get('tier_overhead_ms', {}))
+        self.tier_latency_ms = dict(loaded.get('tier_latency_ms', {}))
+
+    def _reset_explanation_state(self):
+        """Drop cached explanations and latency estimates of the previous model"""
+
+        self.explanation_cache.clear()
+        self.tier_overhead_ms = {}
+        self.tier_latency_ms = {}
+
+    def calibrate_tiers(self):
+        """
+        Seed the per-tier latency estimates (~0.3 s, only needed for
+        deadlines). Done at train time and saved with the model; measured
+        on the training machine, then corrected by the running average.
         """
-        Predict conversion probability with explanation
+
+        # Time each tier on 1 and CALIBRATION_ROWS rows to split per-call
+        # overhead from per-row cost; the first call pays one-off setup, so
+        # only the second of each is recorded
+        features_df = pd.DataFrame(0.0, index=range(CALIBRATION_ROWS), columns=self.feature_columns)
+        probas = self.model.predict_proba(features_df)[:, 1]
+
+        for tier in EXPLANATION_TIERS:
+            elapsed_ms = {}
+            for n_rows in (1, CALIBRATION_ROWS):
+                for _ in range(2):
+                    start = time.perf_counter()
+                    self._explain_tier(tier, features_df.iloc[:n_rows], probas[:n_rows], cache=False)
+                    elapsed_ms[n_rows] = (time.perf_counter() - start) * 1000
+
+            per_row = max(elapsed_ms[CALIBRATION_ROWS] - elapsed_ms[1], 0) / (CALIBRATION_ROWS - 1)
+            self.tier_latency_ms[tier] = per_row
+            self.tier_overhead_ms[tier] = max(elapsed_ms[1] - per_row, 0)
+
+    def predict_with_explanation(self, features, deadline_ms=None):
+        """
+        Predict conversion probability with explanation (deadline_ms: see predict_with_explanation_encoded)
 
         Returns:
         {
@@ -108,129 +197,200 @@ class ExplainableConversionPredictor:
                 {'feature': 'days_since_last_contact', 'impact': -0.05, 'value': 180}
             ],
             'baseline_probability': 0.15,
-            'explanation_summary': 'This lead scores high because...'
+            'explanation_summary': 'This lead scores high because...',
+            'explanation_method': 'shap',
+            'explanation_tier': 'exact'
         }
         """
 
+        return self.predict_with_explanation_batch([features], deadline_ms)[0]
+
+    def predict_with_explanation_batch(self, features_list, deadline_ms=None):
+        """
+        Predict and explain a list of feature dicts with one model (and SHAP)
+        call; rows are encoded independently (see featureSchema)
+        """
+
         # Load model if not already loaded
         if self.model is None:
-            model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
-            model_path = os.path.join(model_dir, 'conversion_predictor_explainable.pkl')
+            self.load_model()
 
-            if not os.path.exists(model_path):
-                # Fall back to regular model
-                model_path = os.path.join(model_dir, 'conversion_predictor.pkl')
+        return self.predict_with_explanation_encoded(encode_features(features_list, self.feature_columns), deadline_ms)
 
-            loaded = joblib.load(model_path)
-            self.model = loaded['model']
-            self.feature_columns = loaded['feature_columns']
-
-            # Try to load explainer
-            if SHAP_AVAILABLE:
-                explainer_path = os.path.join(model_dir, 'conversion_explainer.pkl')
-                if os.path.exists(explainer_path):
-                    self.explainer = joblib.load(explainer_path)
+    def predict_with_explanation_encoded(self, encoded_df, deadline_ms=None):
+        """
+        predict_with_explanation_batch on a frame from featureSchema.encode_features
+        (columns this model was not trained on are ignored, so the frame can be
+        shared with other models; see leadScorer)
+
+        deadline_ms bounds the whole call: after scoring, the richest tier
+        whose running latency estimate fits in the time left is used. Each
+        result reports it in 'explanation_tier' ('exact', 'cached', 'global'
+        or 'score').
+
+        Without a deadline: SHAP ('exact') when the explainer is available,
+        else the feature-importance fallback ('global'). The exact tier
+        without SHAP (XGBoost pred_contribs, explanation_method
+        'tree_contributions') is only chosen under a deadline.
+        """
 
-        # Prepare features
-        features_df = pd.DataFrame([features])
-        features_df = pd.get_dummies(features_df)
+        # One-off setup is not charged to the deadline: loading, and
+        # calibrating a model saved without tier estimates
+        if self.model is None:
+            self.load_model()
+        if deadline_ms is not None and not self.tier_latency_ms:
+            self.calibrate_tiers()
 
-        # Ensure all training features present
-        for col in self.feature_columns:
-            if col not in features_df.columns:
-                features_df[col] = 0
+        start = time.perf_counter()
 
-        features_df = features_df[self.feature_columns]
+        # Prepare features (missing training columns filled with 0)
+        features_df = encoded_df.reindex(columns=self.feature_columns, fill_value=0)
 
         # Predict
-        proba = self.model.predict_proba(features_df)[0, 1]
+        probas = self.model.predict_proba(features_df)[:, 1]
 
-        # Get explanation
-        if self.explainer is not None and SHAP_AVAILABLE:
-            # Use SHAP for explanation
-            explanation = self._explain_with_shap(features_df, proba)
+        if deadline_ms is None:
+            tier = 'exact' if self.explainer is not None and SHAP_AVAILABLE else 'global'
         else:
-            # Fallback to feature importance
-            explanation = self._explain_with_feature_importance(features_df, proba)
+            tier = self._choose_tier(len(features_df), deadline_ms, start)
+
+        tier_start = time.perf_counter()
+        results = self._explain_tier(tier, features_df, probas)
+
+        if len(features_df) and tier in self.tier_latency_ms:
+            elapsed_ms = (time.perf_counter() - tier_start) * 1000
+            ms_per_row = max(elapsed_ms - self.tier_overhead_ms.get(tier, 0), 0) / len(features_df)
+            previous = self.tier_latency_ms.get(tier, ms_per_row)
+            self.tier_latency_ms[tier] = previous + LATENCY_EWMA_ALPHA * (ms_per_row - previous)
+
+        return results
+
+    def _choose_tier(self, n_rows, deadline_ms, start):
+        remaining_ms = deadline_ms - (time.perf_counter() - start) * 1000
+
+        for tier in EXPLANATION_TIERS[:-1]:
+            per_row = self.tier_latency_ms.get(tier)
+            if per_row is not None and self.tier_overhead_ms[tier] + per_row * n_rows <= remaining_ms:
+                return tier
+
+        return 'score'
+
+    def _explain_tier(self, tier, features_df, probas, cache=True):
+        values = features_df.to_numpy(dtype=float)
+
+        if tier == 'score':
+            return [
+                {
+                    'probability': float(proba),
+                    'top_positive_factors': [],
+                    'top_negative_factors': [],
+                    'baseline_probability': None,
+                    'explanation_summary': None,
+                    'explanation_method': None,
+                    'explanation_tier': 'score'
+                }
+                for proba in probas
+            ]
+
+        if tier in ('approximate', 'global'):
+            # Impact = importance * feature_value (simplified)
+            importance_impacts = values * self.model.feature_importances_
+            results = []
 
-        return explanation
+            for row in range(len(values)):
+                cached = self.explanation_cache.get(values[row].tobytes()) if tier == 'approximate' else None
 
-    def _explain_with_shap(self, features_df, proba):
-        """Explain using SHAP values"""
+                if cached is not None:
+                    self.explanation_cache.move_to_end(values[row].tobytes())
+                    impacts, base_value, method = cached
+                    explanation = self._build_explanation(values[row], impacts, probas[row], base_value, method)
+                    explanation['explanation_tier'] = 'cached'
+                else:
+                    # Global importance, weighted by this row's values
+                    explanation = self._build_explanation(
+                        values[row], importance_impacts[row], probas[row],
+                        0.15,  # Approximate baseline
+                        'feature_importance'
+                    )
+                    explanation['explanation_tier'] = 'global'
 
-        # Get SHAP values
-        shap_values = self.explainer.shap_values(features_df)
+                results.append(explanation)
 
-        # Handle different SHAP output formats
-        if isinstance(shap_values, list):
-            shap_values = shap_values[1]  # Positive class
-        elif len(shap_values.shape) > 2:
-            shap_values = shap_values[:, :, 1]  # Positive class
+            return results
 
-        # Get base value
-        base_value = self.explainer.expected_value
-        if isinstance(base_value, np.ndarray):
-            base_value = base_value[1]
+        impacts, base_value, method = self._exact_attributions(features_df)
+        results = []
 
-        # Create feature impact list
-        feature_impacts = []
-        for i, col in enumerate(self.feature_columns):
-            feature_impacts.append({
-                'feature': col,
-                'impact': float(shap_values[0][i]),
-                'value': float(features_df.iloc[0][col]),
-                'feature_readable': self._make_readable(col)
-            })
+        for row in range(len(values)):
+            explanation = self._build_explanation(values[row], impacts[row], probas[row], base_value, method)
+            explanation['explanation_tier'] = 'exact'
+            results.append(explanation)
 
-        # Sort by absolute impact
-        feature_impacts.sort(key=lambda x: abs(x['impact']), reverse=True)
+            if cache:
+                self.explanation_cache[values[row].tobytes()] = (impacts[row], base_value, method)
+                if len(self.explanation_cache) > EXPLANATION_CACHE_SIZE:
+                    self.explanation_cache.popitem(last=False)
 
-        # Separate positive and negative
-        positive_factors = [f for f in feature_impacts if f['impact'] > 0][:5]
-        negative_factors = [f for f in feature_impacts if f['impact'] < 0][:5]
+        return results
 
-        return {
-            'probability': float(proba),
-            'top_positive_factors': positive_factors,
-            'top_negative_factors': negative_factors,
-            'baseline_probability': float(base_value),
-            'explanation_summary': self._generate_summary(positive_factors, negative_factors),
-            'explanation_method': 'shap'
-        }
+    def _exact_attributions(self, features_df):
+        """Per-row feature attributions: (impacts, base_value, method)"""
+
+        if self.explainer is not None and SHAP_AVAILABLE:
+            # Get SHAP values
+            shap_values = self.explainer.shap_values(features_df)
+
+            # Handle different SHAP output formats
+            if isinstance(shap_values, list):
+                shap_values = shap_values[1]  # Positive class
+            elif len(shap_values.shape) > 2:
+                shap_values = shap_values[:, :, 1]  # Positive class
+
+            # Get base value
+            base_value = self.explainer.expected_value
+            if isinstance(base_value, np.ndarray):
+                base_value = base_value[1]
+
+            return shap_values, base_value, 'shap'
+
+        # Without the shap package, XGBoost's built-in TreeSHAP gives the same
+        # attributions (log-odds); the last column is the bias term
+        contribs = self.model.get_booster().predict(
+            DMatrix(features_df, nthread=thread_budget()), pred_contribs=True
+        )
+        base_margin = contribs[0, -1] if len(contribs) else 0.0
 
-    def _explain_with_feature_importance(self, features_df, proba):
-        """Fallback explanation using feature importance"""
+        return contribs[:, :-1], 1 / (1 + np.exp(-base_margin)), 'tree_contributions'
 
-        # Get feature importance from model
-        importances = self.model.feature_importances_
+    def _build_explanation(self, values, impacts, proba, base_value, method):
+        """Build the explanation payload for one row from per-feature impacts"""
 
-        # Create feature impact list
-        feature_impacts = []
-        for i, col in enumerate(self.feature_columns):
-            # Impact = importance * feature_value (simplified)
-            impact = importances[i] * features_df.iloc[0][col]
+        impacts = np.asarray(impacts, dtype=float)
 
-            feature_impacts.append({
-                'feature': col,
-                'impact': float(impact),
-                'value': float(features_df.iloc[0][col]),
-                'feature_readable': self._make_readable(col)
-            })
+        # Sort by absolute impact (stable, so ties keep column order), then
+        # build dicts for the top 5 each way only - one per one-hot column
+        # dominates batch latency otherwise
+        order = np.argsort(-np.abs(impacts), kind='stable')
 
-        # Sort by absolute impact
-        feature_impacts.sort(key=lambda x: abs(x['impact']), reverse=True)
+        def factors(indices):
+            return [{
+                'feature': self.feature_columns[i],
+                'impact': float(impacts[i]),
+                'value': float(values[i]),
+                'feature_readable': self._make_readable(self.feature_columns[i])
+            } for i in indices[:5]]
 
         # Separate positive and negative
-        positive_factors = [f for f in feature_impacts if f['impact'] > 0][:5]
-        negative_factors = [f for f in feature_impacts if f['impact'] < 0][:5]
+        positive_factors = factors(order[impacts[order] > 0])
+        negative_factors = factors(order[impacts[order] < 0])
 
         return {
             'probability': float(proba),
             'top_positive_factors': positive_factors,
             'top_negative_factors': negative_factors,
-            'baseline_probability': 0.15,  # Approximate baseline
+            'baseline_probability': float(base_value),
             'explanation_summary': self._generate_summary(positive_factors, negative_factors),
-            'explanation_method': 'feature_importance'
+            'explanation_method': method
         }
 
     def _make_readable(self, feature_name):
@@ -296,7 +456,25 @@ class ExplainableConversionPredictor:
 
         conn = psycopg2.connect(**self.db_config)
 
-        query = """
+        if self.use_feature_table:
+            query = f"""
+        SELECT
+            industry,
+            active_days_90d,
+            company_open_rate,
+            seniority_level,
+            person_open_rate,
+            eo.converted as label
+
+        FROM {FEATURE_TABLE} eo
+
+        WHERE
+            eo.sent_at > NOW() - INTERVAL '180 days'
+            AND eo.delivered = TRUE
+        LIMIT 1000
+        """
+        else:
+            query = """
         SELECT
             COALESCE((fs_company.features->>'industry')::text, 'unknown') as industry,
             COALESCE((fs_company.features->>'active_days_90d')::int, 0) as active_days_90d,
@@ -329,6 +507,8 @@ class ExplainableConversionPredictor:
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--predict', type=str, help='JSON features for prediction')
+    parser.add_argument('--feature-table', action='store_true', default=feature_table_enabled(),
+                        help='Read features from the flattened ml_training_features table')
     args = parser.parse_args()
 
     db_config = {
@@ -339,14 +519,18 @@ if __name__ == '__main__':
         'password': os.getenv('DB_PASSWORD', '')
     }
 
-    predictor = ExplainableConversionPredictor(db_config)
+    predictor = ExplainableConversionPredictor(db_config, use_feature_table=args.feature_table)
 
     if args.predict:
         # Prediction mode
         input_data = json.loads(args.predict)
 
         if input_data.get('action') == 'predict_with_explanation':
-            result = predictor.predict_with_explanation(input_data.get('features', {}))
+            try:
+                result = predictor.predict_with_explanation(input_data.get('features', {}), input_data.get('deadline_ms'))
+            except ValueError as e:
+                # Invalid features (see featureSchema.coerce_features)
+                result = {'error': str(e)}
             print(json.dumps(result))
         else:
             print(json.dumps({'error': 'Unknown action'}))
@@ -0,0 +1,87 @@
+"""
+Conversion Feature Schema
+
+Training dtypes of the lead features (see ConversionPredictor.training_query),
+and a row-by-row one-hot encoder. pd.get_dummies on a batch infers each
+column's dtype from every row in it, so one request sending a number as a
+string turns that column categorical for the whole batch and changes the
+other rows' predictions. encode_features encodes each row on its own
+against the model's training columns, so a row's prediction never depends
+on what it was batched with.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+# One-hot encoded at training time (prefix_value columns)
+CATEGORICAL_FEATURES = frozenset([
+    'industry', 'size_bucket', 'function', 'seniority_level'
+])
+
+NUMERIC_FEATURES = frozenset([
+    'uae_presence', 'account_age_days', 'active_days_90d', 'emails_sent_total',
+    'company_open_rate', 'company_reply_rate', 'person_emails_received', 'person_open_rate',
+    'subject_length', 'body_word_count', 'personalization_level', 'readability_score',
+    'has_cta', 'spam_words_count', 'send_hour', 'send_day_of_week'
+])
+
+
+def coerce_features(features):
+    """
+    Validate one feature dict and coerce it to the training dtypes; raises
+    ValueError naming the offending feature. None values are dropped (the
+    feature is treated as absent); keys outside the schema pass through.
+    """
+
+    if not isinstance(features, dict):
+        raise ValueError(f"features must be a JSON object, got {type(features).__name__}")
+
+    coerced = {}
+    for key, value in features.items():
+        if value is None:
+            continue
+
+        if isinstance(value, (list, dict)):
+            raise ValueError(f"Feature {key} must be a scalar, got {type(value).__name__}")
+
+        if key in CATEGORICAL_FEATURES:
+            coerced[key] = str(value)
+        elif key in NUMERIC_FEATURES:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature {key} must be numeric, got {value!r}")
+            if not math.isfinite(number):
+                raise ValueError(f"Feature {key} must be finite, got {value!r}")
+            coerced[key] = number
+        else:
+            coerced[key] = value
+
+    return coerced
+
+
+def encode_features(features_list, feature_columns):
+    """
+    One-hot encode feature dicts into a frame with exactly feature_columns,
+    each row independently (same columns pd.get_dummies + reindex produce:
+    strings set their key_value column, numbers their own column, anything
+    not in feature_columns is dropped, missing columns are 0)
+    """
+
+    column_index = {column: i for i, column in enumerate(feature_columns)}
+    encoded = np.zeros((len(features_list), len(feature_columns)))
+
+    for row, features in enumerate(features_list):
+        for key, value in coerce_features(features).items():
+            if isinstance(value, str):
+                i = column_index.get(f'{key}_{value}')
+                if i is not None:
+                    encoded[row, i] = 1.0
+            else:
+                i = column_index.get(key)
+                if i is not None:
+                    encoded[row, i] = float(value)
+
+    return pd.DataFrame(encoded, columns=feature_columns)
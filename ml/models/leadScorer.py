@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Lead Scorer
+
+One call for everything a lead card needs: conversion probability, best
+send slot and the "why" factors. Features are validated, coerced to the
+training dtypes and one-hot encoded once (row by row, against the union
+of the conversion and explainable models' columns), and each of the two
+models reindexes that shared frame to its own columns. The send-slot grid
+is scored once per distinct (industry, function), and each model artifact
+is loaded once per process. Every part is optional.
+
+Input (--predict): one feature dict, or a list of them for a batch
+("-" reads the JSON from stdin).
+Output: {"conversion": {...}, "send_time": {...}, "explanation": {...}} per
+lead, with only the requested parts; a part whose model is missing carries
+{"error": "..."} (send_time falls back to its Tuesday 10 AM default instead).
+--deadline-ms bounds the whole call: the explanation gets whatever time the
+other parts left (see ExplainableConversionPredictor explanation tiers).
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+import argparse
+
+from conversionPredictor import ConversionPredictor
+from sendTimeOptimizer import SendTimeOptimizer
+from featureSchema import coerce_features, encode_features
+
+# Keep stdout clean for the JSON output (explainablePredictor warns on import without SHAP)
+with contextlib.redirect_stdout(sys.stderr):
+    from explainablePredictor import ExplainableConversionPredictor
+
+PARTS = ('conversion', 'send_time', 'explanation')
+
+
+class LeadScorer:
+
+    def __init__(self, db_config, tenant_id=None):
+        self.conversion = ConversionPredictor(db_config, tenant_id=tenant_id)
+        self.send_time = SendTimeOptimizer(db_config, tenant_id=tenant_id)
+        # The explainable model is global only
+        self.explainable = ExplainableConversionPredictor(db_config)
+
+        self.load_errors = {}  # part -> reason its model is unavailable
+        self._loaded = set()
+
+    def load(self, parts=PARTS):
+        """Load the artifacts for `parts` (once each); missing models are recorded, not raised"""
+
+        for part in parts:
+            if part in self._loaded:
+                continue
+            self._loaded.add(part)
+
+            try:
+                if part == 'conversion':
+                    self.conversion.load_model()
+                elif part == 'send_time':
+                    self.send_time.load_model()
+                else:
+                    self.explainable.load_model()
+            except FileNotFoundError as e:
+                # Send time serves its default slot without a model
+                if part != 'send_time':
+                    self.load_errors[part] = str(e)
+
+    def score_batch(self, leads, parts=PARTS, deadline_ms=None):
+        """
+        Score a list of feature dicts; returns one combined payload per lead.
+        deadline_ms (from the start of the call) picks the explanation tier.
+        """
+
+        start = time.perf_counter()
+
+        unknown = set(parts) - set(PARTS)
+        if unknown:
+            raise ValueError(f"Unknown parts: {', '.join(sorted(unknown))} (expected {', '.join(PARTS)})")
+
+        self.load(parts)
+
+        results = [{} for _ in leads]
+        if not leads:
+            return results
+
+        # Raises ValueError naming the bad feature before any model runs
+        leads = [coerce_features(lead) for lead in leads]
+
+        # One encoding shared by the conversion and explainable models
+        models = {'conversion': self.conversion, 'explanation': self.explainable}
+        columns = [
+            column
+            for part in parts if part in models and part not in self.load_errors
+            for column in models[part].feature_columns
+        ]
+        encoded = encode_features(leads, list(dict.fromkeys(columns))) if columns else None
+
+        for part in parts:
+            if part in self.load_errors:
+                outputs = [{'error': self.load_errors[part]} for _ in leads]
+            elif part == 'conversion':
+                outputs = self.conversion.predict_encoded(encoded)
+            elif part == 'send_time':
+                outputs = self.send_time.predict_best_time_batch([
+                    (lead.get('industry') or 'unknown', lead.get('function') or 'unknown')
+                    for lead in leads
+                ])
+            else:
+                remaining_ms = None
+                if deadline_ms is not None:
+                    remaining_ms = max(deadline_ms - (time.perf_counter() - start) * 1000, 0)
+                outputs = self.explainable.predict_with_explanation_encoded(encoded, remaining_ms)
+
+            for result, output in zip(results, outputs):
+                result[part] = output
+
+        return results
+
+    def score(self, lead, parts=PARTS, deadline_ms=None):
+        """Score a single feature dict"""
+
+        return self.score_batch([lead], parts, deadline_ms)[0]
+
+
+# CLI
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--predict', type=str, required=True,
+                        help='JSON feature dict, or a list of them; "-" reads from stdin')
+    parser.add_argument('--parts', type=str, default=','.join(PARTS),
+                        help=f"Comma-separated subset of {','.join(PARTS)}")
+    parser.add_argument('--tenant', type=str, help='Score with this tenant\'s models (default: global)')
+    parser.add_argument('--deadline-ms', type=float,
+                        help='Latency budget for the call; explanations degrade to cheaper tiers to fit')
+    args = parser.parse_args()
+
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'database': os.getenv('DB_NAME', 'upr'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '')
+    }
+
+    try:
+        payload = json.loads(sys.stdin.read() if args.predict == '-' else args.predict)
+        parts = [part.strip() for part in args.parts.split(',') if part.strip()]
+
+        scorer = LeadScorer(db_config, tenant_id=args.tenant)
+
+        if isinstance(payload, list):
+            result = scorer.score_batch(payload, parts, args.deadline_ms)
+        else:
+            result = scorer.score(payload, parts, args.deadline_ms)
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+    print(json.dumps(result))
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Prediction Load / Soak Test Harness
+
+Replays synthetic feature payloads against the prediction CLIs
+(spawn-per-call, as mlService.js does) or a persistent predictionServer,
+and reports latency percentiles, throughput, CPU and RSS over time.
+Runs entirely locally: --build-models trains every model on synthetic data
+into a scratch ML_MODEL_DIR, no database needed.
+
+Examples:
+    python loadHarness.py --build-models /tmp/upr-models
+    python loadHarness.py --model-dir /tmp/upr-models --target cli:conversion --concurrency 8 --requests 200
+    python loadHarness.py --model-dir /tmp/upr-models --target server:conversion --start-server \\
+        --rate 500 --duration 60 --concurrency 64
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CLI_SCRIPTS = {
+    'conversion': 'conversionPredictor.py',
+    'send_time': 'sendTimeOptimizer.py',
+    'explainable': 'explainablePredictor.py'
+}
+
+INDUSTRIES = ['technology', 'finance', 'healthcare', 'retail', 'logistics', 'real_estate', 'unknown']
+FUNCTIONS = ['hr', 'finance', 'admin', 'leadership', 'operations', 'unknown']
+SENIORITY = ['c_level', 'vp', 'director', 'manager', 'unknown']
+SIZE_BUCKETS = ['1-10', '11-50', '51-200', '201-1000', '1000+']
+
+
+# =====================================================
+# Synthetic data and models
+# =====================================================
+
+def synthetic_lead(rng):
+    """One feature payload shaped like the conversion training query"""
+
+    return {
+        'industry': rng.choice(INDUSTRIES),
+        'size_bucket': rng.choice(SIZE_BUCKETS),
+        'uae_presence': rng.randint(0, 1),
+        'account_age_days': rng.randint(0, 1500),
+        'active_days_90d': rng.randint(0, 90),
+        'emails_sent_total': rng.randint(0, 500),
+        'company_open_rate': round(rng.random() * 0.6, 3),
+        'company_reply_rate': round(rng.random() * 0.1, 3),
+        'function': rng.choice(FUNCTIONS),
+        'seniority_level': rng.choice(SENIORITY),
+        'person_emails_received': rng.randint(0, 60),
+        'person_open_rate': round(rng.random() * 0.7, 3),
+        'subject_length': rng.randint(10, 90),
+        'body_word_count': rng.randint(30, 400),
+        'personalization_level': rng.randint(0, 5),
+        'readability_score': round(rng.random() * 100, 1),
+        'has_cta': rng.randint(0, 1),
+        'spam_words_count': rng.randint(0, 4),
+        'send_hour': rng.randint(7, 18),
+        'send_day_of_week': rng.randint(0, 6)
+    }
+
+
+def synthetic_payload(target_model, rng):
+    lead = synthetic_lead(rng)
+
+    if target_model == 'send_time':
+        return {'industry': lead['industry'], 'function': lead['function']}
+    if target_model == 'explainable':
+        return {'action': 'predict_with_explanation', 'features': lead}
+    return lead
+
+
+def synthetic_training_frame(n_rows=20000, seed=42):
+    """Email outcomes with a learnable conversion / open signal"""
+
+    rng = random.Random(seed)
+    df = pd.DataFrame([synthetic_lead(rng) for _ in range(n_rows)])
+
+    np_rng = np.random.default_rng(seed)
+    logit = (
+        -3.2
+        + 2.5 * df['person_open_rate']
+        + 0.02 * df['active_days_90d']
+        + 0.3 * df['has_cta']
+        + 0.4 * (df['seniority_level'] == 'c_level')
+        - 0.3 * df['spam_words_count']
+    )
+    df['label'] = (np_rng.random(n_rows) < 1 / (1 + np.exp(-logit))).astype(int)
+
+    # Send-time columns
+    peak = 9 + df['industry'].map({v: i % 4 for i, v in enumerate(INDUSTRIES)})
+    open_p = 0.2 + 0.15 * np.exp(-((df['send_hour'] - peak) ** 2) / 6)
+    df['opened'] = (np_rng.random(n_rows) < open_p).astype(int)
+    df['sent_at'] = pd.Timestamp.now(tz='UTC') - pd.to_timedelta(np_rng.integers(0, 180 * 24, n_rows), unit='h')
+
+    return df
+
+
+def build_synthetic_models(model_dir, n_rows=20000):
+    """Train every model on synthetic data into model_dir (no database access)"""
+
+    os.environ['ML_MODEL_DIR'] = model_dir
+    os.makedirs(model_dir, exist_ok=True)
+
+    # Keep stdout clean for the JSON report (imports and training print progress)
+    with contextlib.redirect_stdout(sys.stderr):
+        from conversionPredictor import ConversionPredictor
+        from sendTimeOptimizer import SendTimeOptimizer
+        from explainablePredictor import ExplainableConversionPredictor
+
+    df = synthetic_training_frame(n_rows)
+    conversion_df = df.drop(columns=['opened', 'sent_at'])
+    send_time_df = df.rename(columns={'send_day_of_week': 'day_of_week', 'send_hour': 'hour_of_day'})[
+        ['sent_at', 'day_of_week', 'hour_of_day', 'opened', 'industry', 'size_bucket', 'function']
+    ]
+    explainable_df = df[['industry', 'active_days_90d', 'company_open_rate', 'seniority_level',
+                         'person_open_rate', 'label']]
+
+    class SyntheticConversionPredictor(ConversionPredictor):
+        def fetch_training_data(self, *args, **kwargs):
+            return conversion_df
+
+        def _register_model(self, *args):
+            pass
+
+    class SyntheticSendTimeOptimizer(SendTimeOptimizer):
+        def fetch_training_data(self, *args, **kwargs):
+            return send_time_df
+
+        def _register_model(self, *args):
+            pass
+
+    class SyntheticExplainablePredictor(ExplainableConversionPredictor):
+        def fetch_training_data(self, *args, **kwargs):
+            return explainable_df
+
+    with contextlib.redirect_stdout(sys.stderr):
+        SyntheticConversionPredictor({}).train(force=True)
+        SyntheticSendTimeOptimizer({}).train(force=True)
+        SyntheticExplainablePredictor({}).train()
+
+    return model_dir
+
+
+# =====================================================
+# Resource sampling
+# =====================================================
+
+def _proc_cpu_seconds(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def _proc_rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return 0
+
+
+class ResourceSampler:
+    """Samples CPU and RSS of the processes serving predictions"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.pids = set()  # live serving processes (server, or in-flight CLI calls)
+        self.samples = []
+        self._task = None
+
+    def _cpu_seconds(self):
+        # Finished CLI children are accounted by rusage, live ones by /proc
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return children.ru_utime + children.ru_stime + sum(_proc_cpu_seconds(pid) for pid in list(self.pids))
+
+    async def _run(self):
+        start = time.perf_counter()
+        last_t, last_cpu = start, self._cpu_seconds()
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            now, cpu = time.perf_counter(), self._cpu_seconds()
+            self.samples.append({
+                't': round(now - start, 3),
+                'cpu_percent': round(100 * max(cpu - last_cpu, 0) / (now - last_t), 1),
+                'rss_mb': round(sum(_proc_rss_bytes(pid) for pid in list(self.pids)) / 2 ** 20, 1),
+                'processes': len(self.pids)
+            })
+            last_t, last_cpu = now, cpu
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+
+# =====================================================
+# Targets
+# =====================================================
+
+class CliTarget:
+    """Spawn-per-call, like MLService.callPythonModel"""
+
+    def __init__(self, model, sampler, env):
+        self.script = os.path.join(MODELS_DIR, CLI_SCRIPTS[model])
+        self.sampler = sampler
+        self.env = env
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def call(self, payload):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, self.script, '--predict', json.dumps(payload),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=self.env
+        )
+        self.sampler.pids.add(proc.pid)
+        try:
+            stdout, stderr = await proc.communicate()
+        finally:
+            self.sampler.pids.discard(proc.pid)
+
+        if proc.returncode != 0:
+            raise RuntimeError(f'exit {proc.returncode}: {stderr.decode()[-200:]}')
+
+        # Last line is the JSON result (earlier lines may be warnings)
+        result = json.loads(stdout.decode().strip().splitlines()[-1])
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result
+
+
+class ServerTarget:
+    """Persistent predictionServer; one pooled connection per in-flight request"""
+
+    def __init__(self, model, host, port, pool_size):
+        self.model = model
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._pool = asyncio.Queue()
+        self._next_id = 0
+
+    async def open(self):
+        for _ in range(self.pool_size):
+            await self._pool.put(await asyncio.open_connection(self.host, self.port))
+
+    async def close(self):
+        while not self._pool.empty():
+            _, writer = self._pool.get_nowait()
+            writer.close()
+
+    async def call(self, payload):
+        if self.model == 'explainable':
+            payload = payload['features']
+
+        self._next_id += 1
+        request = {'id': self._next_id, 'model': self.model, 'features': payload}
+
+        reader, writer = await self._pool.get()
+        try:
+            writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+        finally:
+            await self._pool.put((reader, writer))
+
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+
+async def start_server(port, env, extra_args):
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(MODELS_DIR, 'predictionServer.py'), '--port', str(port), *extra_args,
+        env=env, stdout=asyncio.subprocess.DEVNULL
+    )
+
+    for _ in range(300):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return proc
+        except OSError:
+            if proc.returncode is not None:
+                raise RuntimeError('predictionServer exited during startup')
+            await asyncio.sleep(0.1)
+
+    proc.terminate()
+    raise RuntimeError('predictionServer did not start listening')
+
+
+# =====================================================
+# Load generation
+# =====================================================
+
+async def run_load(target, payload_fn, concurrency, rate=0.0, duration=None, total=None, seed=0):
+    """
+    Closed loop (rate=0): `concurrency` workers send back-to-back.
+    Open loop (rate>0): Poisson arrivals at `rate`/s, at most `concurrency`
+    in flight. Latency is measured from the scheduled arrival, so time spent
+    waiting for a free slot counts (no coordinated omission).
+    """
+
+    rng = random.Random(seed)
+    latencies = []
+    errors = []
+    sem = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    def more(sent):
+        if total is not None and sent >= total:
+            return False
+        return duration is None or time.perf_counter() - start < duration
+
+    async def one(payload, arrival):
+        async with sem:
+            try:
+                await target.call(payload)
+                latencies.append((time.perf_counter() - arrival) * 1000)
+            except Exception as e:
+                errors.append(str(e))
+
+    if rate > 0:
+        tasks = []
+        next_arrival = start
+        while more(len(tasks)):
+            next_arrival += rng.expovariate(rate)
+            await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+            tasks.append(asyncio.create_task(one(payload_fn(rng), next_arrival)))
+        await asyncio.gather(*tasks)
+    else:
+        sent = 0
+
+        async def worker():
+            nonlocal sent
+            while more(sent):
+                sent += 1
+                await one(payload_fn(rng), time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed, samples):
+    lat = np.array(latencies) if latencies else np.array([np.nan])
+    rss = [s['rss_mb'] for s in samples if s['processes']]
+
+    return {
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'error_examples': sorted(set(errors))[:3],
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(float(np.nanmean(lat)), 2),
+            'p50': round(float(np.nanpercentile(lat, 50)), 2),
+            'p90': round(float(np.nanpercentile(lat, 90)), 2),
+            'p99': round(float(np.nanpercentile(lat, 99)), 2),
+            'max': round(float(np.nanmax(lat)), 2)
+        },
+        'cpu_percent_mean': round(float(np.mean([s['cpu_percent'] for s in samples])), 1) if samples else None,
+        'rss_mb': {
+            'first': rss[0] if rss else None,
+            'peak': max(rss) if rss else None,
+            'last': rss[-1] if rss else None,
+            'growth': round(rss[-1] - rss[0], 1) if rss else None
+        },
+        'timeline': samples
+    }
+
+
+async def main(args):
+    env = {**os.environ, 'ML_MODEL_DIR': os.path.abspath(args.model_dir)}
+    kind, model = args.target.split(':', 1)
+
+    sampler = ResourceSampler(args.sample_interval)
+    server_proc = None
+
+    if kind == 'cli':
+        target = CliTarget(model, sampler, env)
+    else:
+        if args.start_server:
+            server_proc = await start_server(args.port, env, args.server_args.split())
+            sampler.pids.add(server_proc.pid)
+        target = ServerTarget(model, args.host, args.port, args.concurrency)
+
+    await target.open()
+    sampler.start()
+
+    try:
+        latencies, errors, elapsed = await run_load(
+            target,
+            lambda rng: synthetic_payload(model, rng),
+            args.concurrency, args.rate, args.duration, args.requests, args.seed
+        )
+    finally:
+        await sampler.stop()
+        await target.close()
+        if server_proc is not None:
+            server_proc.terminate()
+            await server_proc.wait()
+
+    report = summarize(latencies, errors, elapsed, sampler.samples)
+    report['config'] = {
+        'target': args.target,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'duration': args.duration,
+        'requests': args.requests
+    }
+    return report
+
+
+# CLI
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build-models', type=str, metavar='DIR', help='Train all models on synthetic data into DIR')
+    parser.add_argument('--training-rows', type=int, default=20000)
+    parser.add_argument('--model-dir', type=str, help='Model directory to serve from (ML_MODEL_DIR)')
+    parser.add_argument('--target', type=str, default='cli:conversion',
+                        help='cli:{conversion,send_time,explainable} or server:{conversion,explainable}')
+    parser.add_argument('--concurrency', type=int, default=4, help='Max requests in flight')
+    parser.add_argument('--rate', type=float, default=0.0, help='Open-loop arrivals per second (0 = closed loop)')
+    parser.add_argument('--duration', type=float, help='Run for this many seconds (soak)')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='CPU/RSS sampling interval (s)')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--start-server', action='store_true', help='Launch predictionServer for server:* targets')
+    parser.add_argument('--server-args', type=str, default='', help='Extra predictionServer arguments')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.build_models:
+        build_synthetic_models(os.path.abspath(args.build_models), args.training_rows)
+        print(json.dumps({'model_dir': os.path.abspath(args.build_models)}))
+        if not args.model_dir:
+            sys.exit(0)
+
+    if not args.model_dir:
+        parser.error('--model-dir (or --build-models) is required')
+
+    if args.duration is None and args.requests is None:
+        args.requests = 100
+
+    print(json.dumps(asyncio.run(main(args)), indent=2))
@@ -0,0 +1,270 @@
+"""
+Per-Tenant Model Cache
+
+Keeps tenant models resident under a memory budget with LRU eviction.
+Global models are pinned. A request for a cold tenant is served by the
+global model while the tenant's own model loads in the background.
+
+Retrained models are picked up without a restart: at most every
+refresh_interval_s a served model's artifact is re-checked (its mtime and
+its directory's, which changes when a newer versioned artifact is
+written), and a changed one is reloaded in the background while the old
+model keeps serving. A tenant whose artifact fails to load is logged,
+served by the global model and retried after missing_ttl_s.
+
+The budget is charged with each model's on-disk artifact size, a proxy
+for its resident size rather than a measurement: XGBoost boosters are
+deserialized into native memory (mmap does not apply to them), and their
+in-memory size can differ from the pickle's. Artifacts are loaded with
+joblib mmap_mode='r', which only helps numpy-backed models (e.g.
+RandomForest tree arrays), paged in lazily instead of copied.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from conversionPredictor import ConversionPredictor
+from sendTimeOptimizer import SendTimeOptimizer
+from tenantScope import normalize_tenant_id
+
+
+def load_conversion_predictor(tenant_id):
+    predictor = ConversionPredictor({}, tenant_id=tenant_id)
+    model_path = predictor.load_model(fallback_to_global=False, mmap_mode='r')
+    return predictor, model_path
+
+
+def load_send_time_optimizer(tenant_id):
+    optimizer = SendTimeOptimizer({}, tenant_id=tenant_id)
+    model_path = optimizer.load_model(fallback_to_global=False, mmap_mode='r')
+    return optimizer, model_path
+
+
+DEFAULT_LOADERS = {
+    'conversion': load_conversion_predictor,
+    'send_time': load_send_time_optimizer
+}
+
+
+def artifact_signature(model_path):
+    """Changes when the artifact is rewritten or a new one is written next to it (a retrain)"""
+
+    try:
+        return os.path.getmtime(model_path), os.path.getmtime(os.path.dirname(model_path) or '.')
+    except OSError:
+        return None
+
+
+class ModelCache:
+
+    def __init__(self, loaders=None, memory_budget_mb=512, missing_ttl_s=300, load_workers=2,
+                 refresh_interval_s=60):
+        # {model_name: fn(tenant_id) -> (model, model_path)}; must raise
+        # FileNotFoundError rather than fall back to the global model
+        self.loaders = loaders or DEFAULT_LOADERS
+        self.memory_budget = memory_budget_mb * 2 ** 20
+        # Tenants without a (loadable) trained model are re-checked after this long
+        self.missing_ttl_s = missing_ttl_s
+        # Served models' artifacts are checked for a retrain at most this often
+        self.refresh_interval_s = refresh_interval_s
+
+        self._global = {}  # model_name -> (model, model_path, signature)
+        self._entries = OrderedDict()  # (model_name, tenant_id) -> (model, size_bytes, model_path, signature)
+        self._checked = {}  # (model_name, tenant_id) -> monotonic time of the last artifact check
+        self._resident_bytes = 0
+        self._loading = set()
+        self._missing = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=load_workers)
+
+        self.counters = {
+            'hits': 0,
+            'fallbacks': 0,
+            'loads': 0,
+            'reloads': 0,
+            'load_errors': 0,
+            'evictions': 0,
+            'load_ms_total': 0.0
+        }
+
+    def get_global(self, model_name):
+        """Global model (loaded once and pinned); raises FileNotFoundError if untrained"""
+
+        with self._lock:
+            entry = self._global.get(model_name)
+
+        if entry is not None:
+            self._refresh_if_changed((model_name, None), entry[1], entry[2])
+            return entry[0]
+
+        model, model_path = self.loaders[model_name](None)
+        signature = artifact_signature(model_path)
+
+        with self._lock:
+            self._checked[(model_name, None)] = time.monotonic()
+            return self._global.setdefault(model_name, (model, model_path, signature))[0]
+
+    def get(self, model_name, tenant_id=None, wait=False):
+        """
+        Returns (model, served_tenant_id). served_tenant_id is None when the
+        global model answered. With wait=True a cold tenant is loaded inline.
+        """
+
+        tenant_id = normalize_tenant_id(tenant_id)
+        if tenant_id is None:
+            return self.get_global(model_name), None
+
+        key = (model_name, tenant_id)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+
+        if entry is not None:
+            self._refresh_if_changed(key, entry[2], entry[3])
+            return entry[0], tenant_id
+
+        with self._lock:
+            checked_at = self._missing.get(key)
+            known_missing = checked_at is not None and time.monotonic() - checked_at < self.missing_ttl_s
+            start_load = not known_missing and key not in self._loading
+
+            if start_load:
+                self._loading.add(key)
+
+        if start_load:
+            if wait:
+                self._load(key)
+                return self.get(model_name, tenant_id)
+
+            self._executor.submit(self._load, key)
+
+        with self._lock:
+            self.counters['fallbacks'] += 1
+
+        return self.get_global(model_name), None
+
+    def _refresh_if_changed(self, key, model_path, signature):
+        """Reload a served model in the background if its artifact changed (checked at most every refresh_interval_s)"""
+
+        now = time.monotonic()
+
+        with self._lock:
+            if now - self._checked.get(key, 0) < self.refresh_interval_s or key in self._loading:
+                return
+            self._checked[key] = now
+
+        if artifact_signature(model_path) == signature:
+            return
+
+        with self._lock:
+            if key in self._loading:
+                return
+            self._loading.add(key)
+            self.counters['reloads'] += 1
+
+        self._executor.submit(self._load, key)
+
+    def _load(self, key):
+        model_name, tenant_id = key
+        start = time.perf_counter()
+
+        try:
+            model, model_path = self.loaders[model_name](tenant_id)
+            signature = artifact_signature(model_path)
+            # On-disk artifact size stands in for resident size (see module docstring)
+            size = os.path.getsize(model_path)
+        except Exception as e:
+            missing = isinstance(e, FileNotFoundError)
+            if not missing:
+                print(f"⚠️  Failed to load {model_name} model for {tenant_id or 'global'}: {e}", file=sys.stderr)
+
+            with self._lock:
+                self._loading.discard(key)
+                if not missing:
+                    self.counters['load_errors'] += 1
+                # Retried after missing_ttl_s; a model already being served (a
+                # reload of a corrupt retrained artifact) keeps serving meanwhile
+                if tenant_id is not None and key not in self._entries:
+                    self._missing[key] = time.monotonic()
+            return
+
+        with self._lock:
+            self._loading.discard(key)
+            self._missing.pop(key, None)
+            self._checked[key] = time.monotonic()
+            self.counters['loads'] += 1
+            self.counters['load_ms_total'] += (time.perf_counter() - start) * 1000
+
+            if tenant_id is None:
+                self._global[model_name] = (model, model_path, signature)
+                return
+
+            if key in self._entries:
+                self._resident_bytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (model, size, model_path, signature)
+            self._resident_bytes += size
+
+            # Evict least recently used tenants, but never the one just loaded
+            while self._resident_bytes > self.memory_budget and len(self._entries) > 1:
+                _, (_, evicted_size, *_) = self._entries.popitem(last=False)
+                self._resident_bytes -= evicted_size
+                self.counters['evictions'] += 1
+
+    def invalidate(self, model_name, tenant_id=None):
+        """Drop a cached model (e.g. after retraining) so the next request reloads it"""
+
+        tenant_id = normalize_tenant_id(tenant_id)
+
+        with self._lock:
+            self._checked.pop((model_name, tenant_id), None)
+
+            if tenant_id is None:
+                self._global.pop(model_name, None)
+                return
+
+            key = (model_name, tenant_id)
+            self._missing.pop(key, None)
+            if key in self._entries:
+                self._resident_bytes -= self._entries.pop(key)[1]
+
+    def predict_batch(self, model_name, method, items):
+        """
+        Run `method` over [(tenant_id, features, ...)] items, grouping rows by
+        the model that serves them (tenant model, or global fallback); results
+        come back in input order.
+        """
+
+        groups = {}
+        for i, (tenant_id, *_) in enumerate(items):
+            model, _ = self.get(model_name, tenant_id)
+            groups.setdefault(id(model), (model, []))[1].append(i)
+
+        results = [None] * len(items)
+        for model, indices in groups.values():
+            outputs = getattr(model, method)([items[i][1] for i in indices])
+            for i, output in zip(indices, outputs):
+                results[i] = output
+
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                'resident_models': len(self._entries),
+                'resident_mb': round(self._resident_bytes / 2 ** 20, 2),
+                'memory_budget_mb': round(self.memory_budget / 2 ** 20, 2),
+                'loading': len(self._loading),
+                'known_missing': len(self._missing)
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
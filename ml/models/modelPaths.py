@@ -0,0 +1,22 @@
+"""
+Trained model artifact locations
+"""
+
+import os
+
+from tenantScope import normalize_tenant_id
+
+
+def trained_models_dir(tenant_id=None):
+    """
+    Directory holding trained model artifacts (ML_MODEL_DIR overrides ml/trained_models).
+    Tenant models live under tenants/<tenant_id>/.
+    """
+
+    base = os.getenv('ML_MODEL_DIR', os.path.join(os.path.dirname(__file__), '..', 'trained_models'))
+
+    tenant_id = normalize_tenant_id(tenant_id)
+    if tenant_id is None:
+        return base
+
+    return os.path.join(base, 'tenants', tenant_id)
@@ -0,0 +1,55 @@
+"""
+Prediction Output Formats
+
+JSON (the default) or an Arrow IPC stream for large batches. The Arrow path
+wraps the numpy prediction arrays as typed columns (zero-copy for numeric
+arrays) and writes one record batch to stdout, so no per-row dict is built
+and nothing goes through json.dumps / JSON.parse.
+
+pyarrow is optional and only needed for --output-format arrow.
+"""
+
+import json
+import sys
+
+import numpy as np
+
+# Optional: only needed for Arrow output
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+OUTPUT_FORMATS = ('json', 'arrow')
+
+
+def read_predict_input(value):
+    """--predict argument as JSON; "-" reads it from stdin (batches exceed argv limits)"""
+
+    return json.loads(sys.stdin.read() if value == '-' else value)
+
+
+def write_arrow(columns, stream=None):
+    """
+    Write {name: numpy array} to stream (default: stdout) as an Arrow IPC
+    stream. Zero-length columns still produce a schema and an empty batch,
+    so readers get typed columns rather than an empty stream.
+    """
+
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required for --output-format arrow. Install with: pip install pyarrow")
+
+    if stream is None:
+        sys.stdout.flush()
+        stream = sys.stdout.buffer
+
+    batch = pa.RecordBatch.from_arrays(
+        [pa.array(np.ascontiguousarray(values)) for values in columns.values()],
+        names=list(columns)
+    )
+
+    with pa.ipc.new_stream(stream, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    stream.flush()
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Prediction Server with Dynamic Micro-Batching
+
+Keeps ConversionPredictor / ExplainableConversionPredictor resident and
+coalesces concurrent single-lead requests into one predict_proba call.
+A batch is flushed when it reaches --max-batch-size or when the oldest
+queued request has waited --max-wait-ms, whichever comes first.
+
+Protocol: newline-delimited JSON over TCP
+    -> {"id": 1, "model": "conversion", "tenant_id": "...", "features": {...}}
+    <- {"id": 1, "result": {"probability": 0.42, "confidence": 0.58}}
+    -> {"id": 2, "model": "explainable", "features": {...}, "deadline_ms": 20}
+    -> {"action": "stats"}
+    <- {"result": {"conversion": {"batch_size": {...}, "queue_delay_ms": {...}}, "model_cache": {...}, "resources": {...}}}
+
+tenant_id is optional; tenant models come from a size-budgeted LRU
+ModelCache, and a cold tenant is answered by the global model while its
+own model loads; retrained artifacts are reloaded without a restart.
+
+deadline_ms (explainable model) counts from when the request arrives, so
+queueing uses part of it. A flushed batch is split by deadline: requests
+without one are explained together on the default (exact / global) path,
+and the rest are grouped so each runs under a deadline at most
+DEADLINE_GROUP_RATIO times tighter than its own (see
+ExplainableConversionPredictor explanation tiers).
+
+features are validated and coerced to the training dtypes per request
+(a bad request gets its own error), and rows are encoded independently,
+so batching never changes a result. If a batch still fails, its rows are
+retried one at a time and only the failing request gets the error.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from explainablePredictor import ExplainableConversionPredictor
+from modelCache import ModelCache
+from featureSchema import coerce_features
+from resourceGovernor import configure as configure_resources
+from tenantScope import normalize_tenant_id
+
+# A request with a deadline shares an explanation call only with requests
+# whose remaining time is within this factor of the tightest one
+DEADLINE_GROUP_RATIO = 2.0
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+QUEUE_DELAY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250]
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style upper bounds)"""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q-th quantile"""
+
+        if self.count == 0:
+            return None
+
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'buckets': [
+                {'le': bound, 'count': c}
+                for bound, c in zip(self.bounds + ['+Inf'], self.counts)
+            ],
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.50),
+            'p99': self.quantile(0.99)
+        }
+
+
+class MicroBatcher:
+    """Queues single requests and flushes them to a batch predict function"""
+
+    def __init__(self, predict_batch_fn, max_batch_size=32, max_wait_ms=2.0):
+        self.predict_batch_fn = predict_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.batch_size_hist = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delay_hist = Histogram(QUEUE_DELAY_BUCKETS_MS)
+
+        self.batch_retries = 0  # batches that failed and were retried row by row
+
+        self._queue = asyncio.Queue()
+        # One thread per model: the event loop keeps accepting requests while
+        # a batch is in predict_proba, and models are never called concurrently
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, item):
+        """Enqueue one request item and wait for its result"""
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._next_batch()
+
+            flushed_at = time.perf_counter()
+            self.batch_size_hist.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                self.queue_delay_hist.observe((flushed_at - enqueued_at) * 1000)
+
+            items = [item for item, _, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict_batch_fn, items)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    continue
+
+                # Isolate the failing request(s): retry each row on its own
+                self.batch_retries += 1
+                for item, future, _ in batch:
+                    try:
+                        result = (await loop.run_in_executor(self._executor, self.predict_batch_fn, [item]))[0]
+                    except Exception as row_error:
+                        if not future.done():
+                            future.set_exception(row_error)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'batch_retries': self.batch_retries,
+            'batch_size': self.batch_size_hist.snapshot(),
+            'queue_delay_ms': self.queue_delay_hist.snapshot()
+        }
+
+
+class PredictionServer:
+    """Newline-delimited JSON front end over one MicroBatcher per model"""
+
+    def __init__(self, predict_batch_fns, max_batch_size=32, max_wait_ms=2.0, model_cache=None, governor=None):
+        self.predict_batch_fns = predict_batch_fns
+        self.model_cache = model_cache
+        self.governor = governor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batchers = {}
+
+    async def start(self, host, port):
+        for name, fn in self.predict_batch_fns.items():
+            batcher = MicroBatcher(fn, self.max_batch_size, self.max_wait_ms)
+            batcher.start()
+            self.batchers[name] = batcher
+
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    async def stop(self):
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        if self.model_cache is not None:
+            self.model_cache.shutdown()
+
+    def stats(self):
+        stats = {name: batcher.stats() for name, batcher in self.batchers.items()}
+        if self.model_cache is not None:
+            stats['model_cache'] = self.model_cache.stats()
+        if self.governor is not None:
+            stats['resources'] = self.governor.report()
+        return stats
+
+    async def handle_request(self, request):
+        """Route one decoded request; returns the response dict"""
+
+        response = {'id': request.get('id')} if 'id' in request else {}
+
+        if request.get('action') == 'stats':
+            response['result'] = self.stats()
+            return response
+
+        batcher = self.batchers.get(request.get('model', 'conversion'))
+        if batcher is None:
+            response['error'] = f"Unknown model: {request.get('model')}"
+            return response
+
+        try:
+            tenant_id = normalize_tenant_id(request.get('tenant_id'))
+        except ValueError:
+            response['error'] = f"Invalid tenant_id: {request.get('tenant_id')}"
+            return response
+
+        arrived_at = time.perf_counter()
+
+        try:
+            features = coerce_features(request.get('features', {}))
+        except ValueError as e:
+            response['error'] = str(e)
+            return response
+
+        deadline_ms = request.get('deadline_ms')
+        if deadline_ms is not None and (isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float))
+                                        or deadline_ms < 0):
+            response['error'] = f"Invalid deadline_ms: {deadline_ms}"
+            return response
+
+        deadline_at = arrived_at + deadline_ms / 1000 if deadline_ms is not None else None
+
+        try:
+            response['result'] = await batcher.submit((tenant_id, features, deadline_at))
+        except Exception as e:
+            response['error'] = str(e)
+
+        return response
+
+    async def _handle_line(self, line, writer):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {'error': f'Invalid JSON: {e}'}
+        else:
+            response = await self.handle_request(request)
+
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        # Requests on one connection are handled concurrently so that a client
+        # pipelining many leads gets them batched together; responses carry
+        # the request id and may arrive out of order
+        pending = set()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                task = asyncio.create_task(self._handle_line(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+
+def deadline_groups(items, now):
+    """
+    Split (tenant_id, features, deadline_at) items into [(deadline_at, indices)]
+    to explain together: tightest deadline first, one group per
+    DEADLINE_GROUP_RATIO band, and requests without a deadline last (None)
+    """
+
+    timed = sorted(
+        (max(deadline_at - now, 0), i) for i, (_, _, deadline_at) in enumerate(items) if deadline_at is not None
+    )
+
+    groups = []
+    group_remaining = None
+    for remaining, i in timed:
+        if groups and remaining <= group_remaining * DEADLINE_GROUP_RATIO:
+            groups[-1][1].append(i)
+        else:
+            group_remaining = remaining
+            groups.append((items[i][2], [i]))
+
+    untimed = [i for i, (_, _, deadline_at) in enumerate(items) if deadline_at is None]
+    if untimed:
+        groups.append((None, untimed))
+
+    return groups
+
+
+def load_predict_batch_fns(db_config, model_cache):
+    """
+    Load every available global model once; returns {model_name: predict_batch_fn}.
+    Each fn takes a list of (tenant_id, features, deadline_at) items; deadline_at
+    is a time.perf_counter() value or None.
+    """
+
+    fns = {}
+
+    try:
+        model_cache.get_global('conversion')
+        fns['conversion'] = lambda items: model_cache.predict_batch('conversion', 'predict_batch', items)
+    except FileNotFoundError as e:
+        print(f"⚠️  Conversion model not loaded: {e}", file=sys.stderr)
+
+    # The explainable model is global only
+    explainable = ExplainableConversionPredictor(db_config)
+
+    def explain_batch(items):
+        results = [None] * len(items)
+
+        for deadline_at, indices in deadline_groups(items, time.perf_counter()):
+            # Time left now, after queueing and any earlier groups
+            deadline_ms = None if deadline_at is None else max(deadline_at - time.perf_counter(), 0) * 1000
+            outputs = explainable.predict_with_explanation_batch([items[i][1] for i in indices], deadline_ms)
+            for i, output in zip(indices, outputs):
+                results[i] = output
+
+        return results
+
+    try:
+        explainable.load_model()
+        # Re-measure the tier latencies on this machine (the saved ones come from training)
+        explainable.calibrate_tiers()
+        fns['explainable'] = explain_batch
+    except FileNotFoundError as e:
+        print(f"⚠️  Explainable model not loaded: {e}", file=sys.stderr)
+
+    return fns
+
+
+async def serve(host, port, max_batch_size, max_wait_ms, model_cache_mb, db_config):
+    # Before any model loads: each model's MicroBatcher thread (conversion,
+    # explainable) can be in predict_proba at the same time
+    governor = configure_resources(concurrency=2)
+
+    if model_cache_mb is None:
+        model_cache_mb = governor.memory_budget_mb(0.25, 512)
+
+    model_cache = ModelCache(memory_budget_mb=model_cache_mb)
+
+    fns = load_predict_batch_fns(db_config, model_cache)
+    if not fns:
+        print(json.dumps({'error': 'No trained model found'}))
+        sys.exit(1)
+
+    server = PredictionServer(fns, max_batch_size, max_wait_ms, model_cache, governor)
+    tcp_server = await server.start(host, port)
+
+    print(f"✅ Prediction server listening on {host}:{port} "
+          f"(models: {', '.join(fns)}; max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}, "
+          f"model_cache_mb={model_cache_mb})",
+          file=sys.stderr)
+    print(f"🧮 {governor.summary()}", file=sys.stderr)
+
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await server.stop()
+
+
+# CLI
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default=os.getenv('ML_SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('ML_SERVER_PORT', 8765)))
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Flush when this many requests are queued')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='Flush when the oldest request has waited this long')
+    parser.add_argument('--model-cache-mb', type=float,
+                        default=float(os.environ['ML_MODEL_CACHE_MB']) if os.getenv('ML_MODEL_CACHE_MB') else None,
+                        help='Budget for resident tenant models, counted as their on-disk artifact size '
+                             '(LRU eviction; default: 25%% of the container memory limit, at most 512)')
+    args = parser.parse_args()
+
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'database': os.getenv('DB_NAME', 'upr'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '')
+    }
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_wait_ms, args.model_cache_mb, db_config))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Resource Governor
+
+Containers with a fractional CPU quota (Cloud Run, Kubernetes) still show
+every host core to os.cpu_count(), so n_jobs=-1, XGBoost's default thread
+count and OpenMP/BLAS pools all oversubscribe the quota and thrash. This
+reads the cgroup (v2 or v1) CPU quota and memory limit once, splits the
+usable cores across the workers sharing the container (and the model
+calls each worker runs at once), and applies that thread budget to
+BLAS/OpenMP (threadpoolctl + env for child processes). XGBoost and
+scikit-learn models take it through thread_budget() as n_jobs.
+
+    ML_CPU_LIMIT  override the detected CPU quota (cores, may be fractional)
+    ML_WORKERS    processes in this container running models concurrently
+
+Run directly to print the detected limits and chosen settings.
+"""
+
+import json
+import math
+import os
+import sys
+import argparse
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Read by OpenMP / BLAS runtimes at load time, and inherited by loky workers
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'LOKY_MAX_CPU_COUNT'
+]
+
+# cgroup v1 reports "no limit" as a huge page-aligned number
+UNLIMITED_MEMORY = 2 ** 60
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_dirs(root, controller):
+    """Candidate cgroup directories for a controller, most specific first"""
+
+    dirs = []
+    for line in (_read('/proc/self/cgroup') or '').splitlines():
+        _, controllers, path = line.split(':', 2)
+        path = path.lstrip('/')
+        if controllers == '':
+            # v2 unified hierarchy
+            dirs.append(os.path.join(root, path))
+        elif controller in controllers.split(','):
+            dirs += [os.path.join(root, controllers, path), os.path.join(root, controller, path)]
+
+    # Inside a container the namespaced cgroup is usually mounted at the root
+    return dirs + [root, os.path.join(root, controller)]
+
+
+def _first(root, controller, filename):
+    for d in _cgroup_dirs(root, controller):
+        value = _read(os.path.join(d, filename))
+        if value is not None:
+            return value
+    return None
+
+
+def read_cgroup_limits(root=CGROUP_ROOT):
+    """Returns {'cgroup_version', 'cpu_quota' (cores or None), 'memory_limit_bytes' (or None)}"""
+
+    limits = {'cgroup_version': None, 'cpu_quota': None, 'memory_limit_bytes': None}
+
+    if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+        # cgroup v2: cpu.max = "<quota> <period>" or "max <period>"
+        limits['cgroup_version'] = 2
+
+        cpu_max = _first(root, 'cpu', 'cpu.max')
+        if cpu_max:
+            quota, period = cpu_max.split()
+            if quota != 'max':
+                limits['cpu_quota'] = int(quota) / int(period)
+
+        memory_max = _first(root, 'memory', 'memory.max')
+        if memory_max and memory_max != 'max':
+            limits['memory_limit_bytes'] = int(memory_max)
+
+        return limits
+
+    # cgroup v1: cfs_quota_us = -1 means unlimited
+    quota = _first(root, 'cpu', 'cpu.cfs_quota_us')
+    period = _first(root, 'cpu', 'cpu.cfs_period_us')
+    if quota is not None and period is not None:
+        limits['cgroup_version'] = 1
+        if int(quota) > 0:
+            limits['cpu_quota'] = int(quota) / int(period)
+
+    memory = _first(root, 'memory', 'memory.limit_in_bytes')
+    if memory is not None:
+        limits['cgroup_version'] = 1
+        if int(memory) < UNLIMITED_MEMORY:
+            limits['memory_limit_bytes'] = int(memory)
+
+    return limits
+
+
+def available_cpus():
+    """CPUs this process may run on (affinity mask), ignoring quotas"""
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ResourceGovernor:
+
+    def __init__(self, workers=None, concurrency=1, cpu_limit=None, cgroup_root=CGROUP_ROOT):
+        self.limits = read_cgroup_limits(cgroup_root)
+        self.affinity_cpus = available_cpus()
+
+        if cpu_limit is None and os.getenv('ML_CPU_LIMIT'):
+            cpu_limit = float(os.environ['ML_CPU_LIMIT'])
+        self.cpu_limit = cpu_limit if cpu_limit is not None else self.limits['cpu_quota']
+
+        # Whole cores only: a 1.5 CPU quota runs one thread flat out rather
+        # than two threads throttled every period
+        self.cpus = self.affinity_cpus
+        if self.cpu_limit is not None:
+            self.cpus = max(1, min(self.affinity_cpus, math.floor(self.cpu_limit)))
+
+        if workers is None:
+            workers = int(os.getenv('ML_WORKERS', 1))
+        self.workers = max(1, workers)
+        self.threads = max(1, self.cpus // self.workers)
+
+        # Model calls one worker runs at once (e.g. one per model in the prediction server)
+        self.concurrency = max(1, concurrency)
+        self.threads_per_call = max(1, self.threads // self.concurrency)
+
+        self.applied = False
+
+    def apply(self):
+        """Limit BLAS / OpenMP pools in this process and in child processes"""
+
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(self.threads_per_call if var != 'LOKY_MAX_CPU_COUNT' else self.threads)
+
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=self.threads_per_call)
+        except ImportError:
+            pass
+
+        self.applied = True
+        return self
+
+    def memory_budget_mb(self, fraction, default):
+        """fraction of the memory limit in MB, capped at default (default if unlimited)"""
+
+        if self.limits['memory_limit_bytes'] is None:
+            return default
+
+        return min(default, round(self.limits['memory_limit_bytes'] * fraction / 2 ** 20, 1))
+
+    def report(self):
+        memory = self.limits['memory_limit_bytes']
+
+        return {
+            'cgroup_version': self.limits['cgroup_version'],
+            'cpu_quota': self.limits['cpu_quota'],
+            'cpu_limit': self.cpu_limit,
+            'host_cpus': os.cpu_count(),
+            'affinity_cpus': self.affinity_cpus,
+            'usable_cpus': self.cpus,
+            'memory_limit_mb': round(memory / 2 ** 20, 1) if memory else None,
+            'workers': self.workers,
+            'threads_per_worker': self.threads,
+            'concurrency': self.concurrency,
+            'threads_per_call': self.threads_per_call,
+            'oversubscribed': self.workers * self.concurrency > self.cpus,
+            'applied': self.applied
+        }
+
+    def summary(self):
+        memory = self.limits['memory_limit_bytes']
+        return (f"{self.threads_per_call} thread(s) per model call, {self.concurrency} call(s) "
+                f"per worker × {self.workers} worker(s) on {self.cpus} usable CPU(s) (quota {self.cpu_limit or 'none'}, "
+                f"memory limit {f'{memory / 2 ** 20:.0f} MB' if memory else 'none'})")
+
+
+_governor = None
+
+
+def configure(workers=None, concurrency=1, cpu_limit=None):
+    """(Re)build and apply the process-wide governor, e.g. once the worker count is known"""
+
+    global _governor
+    _governor = ResourceGovernor(workers, concurrency, cpu_limit).apply()
+    return _governor
+
+
+def get_governor():
+    """Process-wide governor, detected and applied on first use"""
+
+    return _governor or configure()
+
+
+def thread_budget():
+    """n_jobs for one XGBoost / scikit-learn model call in this worker"""
+
+    return get_governor().threads_per_call
+
+
+def limit_model_threads(model):
+    """Set n_jobs on a loaded model (its pickled value reflects the training host)"""
+
+    if hasattr(model, 'get_params') and 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=thread_budget())
+
+    return model
+
+
+# CLI
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, help='Concurrent workers sharing the container (default: ML_WORKERS or 1)')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrent model calls per worker')
+    parser.add_argument('--cpu-limit', type=float, help='Override the detected CPU quota')
+    args = parser.parse_args()
+
+    governor = configure(args.workers, args.concurrency, args.cpu_limit)
+    report = governor.report()
+    print(json.dumps(report, indent=2))
+
+    if report['oversubscribed']:
+        print(f"⚠️  {governor.workers * governor.concurrency} concurrent model calls on "
+              f"{governor.cpus} usable CPU(s)", file=sys.stderr)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Send Slot Planner
+
+predict_best_time sends every recipient of an (industry, function) segment
+to the same argmax slot, so a large campaign lands thousands of sends in
+one hour and runs into mail-provider rate limits. This assigns a
+campaign's recipients to send slots under per-slot capacities, maximising
+the total predicted open rate.
+
+Recipients of one segment are interchangeable, so the problem is a
+transportation problem on the segments × slots score matrix from
+SendTimeOptimizer.slot_scores, not on individual recipients: its size
+depends on the number of distinct segments (segments the model scores
+identically are merged), not the campaign size.
+
+    optimal  exact, as a linear program (HiGHS interior point + crossover
+             via scipy). The constraint matrix is totally unimodular, so
+             the vertex solution is integral. Above LP_MAX_SEGMENTS
+             distinct segments greedy is used instead.
+    greedy   highest-scoring (segment, slot) pairs first, filled up to the
+             remaining segment size / slot capacity
+
+Recipients are left unplanned only once every slot is full.
+
+Input (--plan): {"recipients": [{"industry", "function"}, ...],
+                 "capacities": [{"day_of_week", "hour_of_day", "capacity"}, ...],
+                 "default_capacity": N (slots not listed; omit for unlimited),
+                 "method": "optimal" | "greedy"}
+("-" reads the JSON from stdin).
+"""
+
+import json
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, vstack
+
+from sendTimeOptimizer import SendTimeOptimizer
+from outputFormat import OUTPUT_FORMATS, PYARROW_AVAILABLE, read_predict_input, write_arrow
+
+PLAN_METHODS = ('optimal', 'greedy')
+
+# Largest LP solved exactly (~1.5 s at 84 slots); greedy is within a fraction of a percent
+LP_MAX_SEGMENTS = 2000
+
+# Unplanned recipients (capacity exhausted)
+UNPLANNED = -1
+
+# Capacity of slots without a limit
+UNLIMITED_CAPACITY = np.iinfo(np.int64).max // 4
+
+
+def greedy_assignment(scores, demand, capacity):
+    """Segments × slots counts: best-scoring pairs first, each filled as far as it can go"""
+
+    flow = np.zeros(scores.shape, dtype=np.int64)
+    demand = demand.astype(np.int64).copy()
+    capacity = capacity.astype(np.int64).copy()
+    n_slots = scores.shape[1]
+
+    for pair in np.argsort(-scores, axis=None, kind='stable'):
+        segment, slot = divmod(int(pair), n_slots)
+        count = min(demand[segment], capacity[slot])
+        if count > 0:
+            flow[segment, slot] = count
+            demand[segment] -= count
+            capacity[slot] -= count
+
+    return flow
+
+
+def optimal_assignment(scores, demand, capacity):
+    """Segments × slots counts maximising total score (None if the LP solver fails)"""
+
+    n_segments, n_slots = scores.shape
+    n_vars = n_segments * n_slots
+
+    # x[s, t] flattened row-major: one row per segment (its recipients), one per slot (its capacity)
+    cols = np.arange(n_vars)
+    segment_rows = csr_matrix((np.ones(n_vars), (cols // n_slots, cols)), shape=(n_segments, n_vars))
+    slot_rows = csr_matrix((np.ones(n_vars), (cols % n_slots, cols)), shape=(n_slots, n_vars))
+
+    result = linprog(
+        -scores.ravel(),
+        A_ub=vstack([segment_rows, slot_rows]).tocsr(),
+        b_ub=np.concatenate([demand, capacity]).astype(float),
+        bounds=(0, None),
+        method='highs-ipm'
+    )
+
+    if result.status != 0:
+        return None
+
+    flow = np.rint(result.x).astype(np.int64).reshape(n_segments, n_slots)
+
+    # Guard against solver round-off breaking a constraint
+    if (flow < 0).any() or (flow.sum(axis=1) > demand).any() or (flow.sum(axis=0) > capacity).any():
+        return None
+
+    return flow
+
+
+class SendSlotPlanner:
+
+    def __init__(self, db_config, tenant_id=None):
+        self.optimizer = SendTimeOptimizer(db_config, tenant_id=tenant_id)
+
+    def slot_capacities(self, days, hours, capacities, default_capacity=None):
+        """Capacity per grid slot; unlisted slots get default_capacity (None = unlimited)"""
+
+        slot_index = {(int(day), int(hour)): i for i, (day, hour) in enumerate(zip(days, hours))}
+        capacity = np.full(len(slot_index), UNLIMITED_CAPACITY if default_capacity is None else int(default_capacity),
+                           dtype=np.int64)
+
+        for entry in capacities:
+            key = (int(entry['day_of_week']), int(entry['hour_of_day']))
+            if key not in slot_index:
+                raise ValueError(f"No send slot for day_of_week={key[0]}, hour_of_day={key[1]} "
+                                 f"(slots are hours {min(hours)}-{max(hours)})")
+            if int(entry['capacity']) < 0:
+                raise ValueError(f"Negative capacity for day_of_week={key[0]}, hour_of_day={key[1]}")
+            capacity[slot_index[key]] = int(entry['capacity'])
+
+        return capacity
+
+    def plan_columns(self, recipients, capacities, default_capacity=None, method='optimal'):
+        """
+        Slot for each (industry, function) in recipients, as ({column: numpy
+        array}, summary). Unplanned recipients get day_of_week / hour_of_day
+        -1 and a NaN predicted_open_rate.
+        """
+
+        if method not in PLAN_METHODS:
+            raise ValueError(f"Unknown method: {method} (expected {', '.join(PLAN_METHODS)})")
+
+        start = time.perf_counter()
+
+        if self.optimizer.model is None:
+            self.optimizer.load_model()
+
+        if not recipients:
+            return {
+                'day_of_week': np.empty(0, dtype=np.int8),
+                'hour_of_day': np.empty(0, dtype=np.int8),
+                'predicted_open_rate': np.empty(0)
+            }, {'recipients': 0, 'planned': 0, 'unplanned': 0, 'method': method}
+
+        grid = self.optimizer.slot_scores(recipients)
+        scored_s = time.perf_counter() - start
+
+        capacity = self.slot_capacities(grid['days'], grid['hours'], capacities, default_capacity)
+
+        # Segments with identical score rows are one segment to the planner
+        # (fewer LP variables, and no degenerate ties between them)
+        open_rates, group = np.unique(grid['scores'], axis=0, return_inverse=True)
+        segment = group.reshape(-1)[grid['segment']]
+        demand = np.bincount(segment, minlength=len(open_rates))
+
+        # Open rates are positive in practice; keep every assignment strictly
+        # worth making so no recipient is left out while a slot has room
+        scores = np.maximum(open_rates, 1e-9)
+
+        # No slot can take more than every recipient (keeps LP bounds finite-sized)
+        solver_capacity = np.minimum(capacity, len(segment))
+
+        solve_start = time.perf_counter()
+        used_method = method
+        flow = None
+        if method == 'optimal' and len(scores) <= LP_MAX_SEGMENTS:
+            flow = optimal_assignment(scores, demand, solver_capacity)
+            if flow is None:
+                print("⚠️  LP solver failed, falling back to greedy assignment", file=sys.stderr)
+        if flow is None:
+            used_method = 'greedy'
+            flow = greedy_assignment(scores, demand, solver_capacity)
+        solve_s = time.perf_counter() - solve_start
+
+        # Hand each segment's slots out to its recipients in input order
+        slot = np.full(len(segment), UNPLANNED, dtype=np.int64)
+        order = np.argsort(segment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(demand)])
+        n_slots = len(capacity)
+
+        for s in range(len(demand)):
+            slots = np.repeat(np.arange(n_slots), flow[s])
+            slot[order[offsets[s]:offsets[s] + len(slots)]] = slots
+
+        planned = slot != UNPLANNED
+        safe_slot = np.where(planned, slot, 0)
+
+        columns = {
+            'day_of_week': np.where(planned, grid['days'][safe_slot], UNPLANNED).astype(np.int8),
+            'hour_of_day': np.where(planned, grid['hours'][safe_slot], UNPLANNED).astype(np.int8),
+            'predicted_open_rate': np.where(planned, open_rates[segment, safe_slot], np.nan)
+        }
+
+        # Unconstrained argmax plan, for comparison
+        best_slot = open_rates.argmax(axis=1)
+        argmax_load = np.bincount(best_slot[segment], minlength=n_slots)
+        load = flow.sum(axis=0)
+        limited = capacity < UNLIMITED_CAPACITY
+
+        summary = {
+            'recipients': int(len(segment)),
+            'segments': int(len(grid['segments'])),
+            'distinct_segments': int(len(open_rates)),
+            'planned': int(planned.sum()),
+            'unplanned': int((~planned).sum()),
+            'method': used_method,
+            'expected_opens': round(float(columns['predicted_open_rate'][planned].sum()), 2),
+            'argmax_expected_opens': round(float(open_rates.max(axis=1)[segment].sum()), 2),
+            'argmax_over_capacity': int(np.maximum(argmax_load - capacity, 0)[limited].sum()),
+            'slots_used': int((load > 0).sum()),
+            'max_slot_load': int(load.max()),
+            'scoring_ms': round(scored_s * 1000, 1),
+            'solve_ms': round(solve_s * 1000, 1),
+            'total_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+
+        return columns, summary
+
+    def plan(self, recipients, capacities, default_capacity=None, method='optimal'):
+        """plan_columns as {'assignments': one dict per recipient (None if unplanned), 'summary': {...}}"""
+
+        columns, summary = self.plan_columns(recipients, capacities, default_capacity, method)
+
+        assignments = [
+            {
+                'day_of_week': int(day),
+                'hour_of_day': int(hour),
+                'predicted_open_rate': float(rate)
+            } if day != UNPLANNED else None
+            for day, hour, rate in zip(
+                columns['day_of_week'], columns['hour_of_day'], columns['predicted_open_rate']
+            )
+        ]
+
+        return {'assignments': assignments, 'summary': summary}
+
+
+# CLI
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--plan', type=str, required=True,
+                        help='JSON {recipients, capacities, default_capacity, method}; "-" reads from stdin')
+    parser.add_argument('--method', choices=PLAN_METHODS, help='Overrides "method" in the input')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help='arrow: Arrow IPC stream of day_of_week/hour_of_day/predicted_open_rate columns '
+                             '(summary on stderr; needs pyarrow)')
+    parser.add_argument('--tenant', type=str, help='Plan with this tenant\'s send time model (default: global)')
+    args = parser.parse_args()
+
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'database': os.getenv('DB_NAME', 'upr'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '')
+    }
+
+    if args.output_format == 'arrow' and not PYARROW_AVAILABLE:
+        print(json.dumps({'error': 'pyarrow is required for --output-format arrow'}))
+        sys.exit(1)
+
+    try:
+        request = read_predict_input(args.plan)
+        recipients = [
+            (item.get('industry') or 'unknown', item.get('function') or 'unknown')
+            for item in request.get('recipients', [])
+        ]
+
+        planner = SendSlotPlanner(db_config, tenant_id=args.tenant)
+        plan_args = (
+            recipients,
+            request.get('capacities', []),
+            request.get('default_capacity'),
+            args.method or request.get('method', 'optimal')
+        )
+
+        if args.output_format == 'arrow':
+            columns, summary = planner.plan_columns(*plan_args)
+        else:
+            result = planner.plan(*plan_args)
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+    if args.output_format == 'arrow':
+        print(json.dumps(summary), file=sys.stderr)
+        write_arrow(columns)
+    else:
+        print(json.dumps(result))
@@ -17,20 +17,41 @@ import sys
 import json
 import argparse
 
+from modelPaths import trained_models_dir
+from tenantScope import normalize_tenant_id, tenant_outcomes_filter
+from trainingFingerprint import check_training_fingerprint, default_min_new_rows
+from resourceGovernor import get_governor, thread_budget, limit_model_threads
+from outputFormat import OUTPUT_FORMATS, PYARROW_AVAILABLE, read_predict_input, write_arrow
+
+# Rows used for training (alias eo); also fingerprinted to skip redundant retrains.
+# Whole days up to today, so the window (and its fingerprint) only moves once a day
+TRAINING_WINDOW_SQL = """
+            eo.sent_at >= date_trunc('day', NOW()) - INTERVAL '180 days'
+            AND eo.sent_at < date_trunc('day', NOW())
+            AND eo.delivered = TRUE
+"""
+
 class SendTimeOptimizer:
 
-    def __init__(self, db_config):
+    def __init__(self, db_config, tenant_id=None):
         self.db_config = db_config
+        self.tenant_id = normalize_tenant_id(tenant_id)  # None = global model
         self.model = None
         self.feature_columns = None
+        self.training_groups = 0
+        self.data_fingerprint = None
+
+    def _training_window(self):
+        return TRAINING_WINDOW_SQL + tenant_outcomes_filter(self.tenant_id)
 
     def fetch_training_data(self):
         """Fetch email outcomes with send time and open rate"""
 
         conn = psycopg2.connect(**self.db_config)
 
-        query = """
+        query = f"""
         SELECT
+            eo.sent_at,
             EXTRACT(DOW FROM sent_at) as day_of_week,
             EXTRACT(HOUR FROM sent_at) as hour_of_day,
             CASE WHEN opened THEN 1 ELSE 0 END as opened,
@@ -47,9 +68,7 @@ class SendTimeOptimizer:
         LEFT JOIN companies c ON c.id = eo.company_id
         LEFT JOIN people p ON p.id = eo.person_id
 
-        WHERE
-            eo.sent_at > NOW() - INTERVAL '180 days'
-            AND eo.delivered = TRUE
+        WHERE {self._training_window()}
         """
 
         try:
@@ -62,10 +81,23 @@ class SendTimeOptimizer:
 
         return df
 
-    def train(self):
-        """Train the model"""
+    def train(self, force=False, min_new_rows=0):
+        """Train the model (returns False when skipped because the training data is unchanged)"""
 
-        print("Fetching send time data...")
+        if not force:
+            # Segments come from companies/people, not feature_store
+            skip, reason, self.data_fingerprint = check_training_fingerprint(
+                self.db_config, 'send_time_optimizer', self._training_window(), min_new_rows,
+                include_features=False, tenant_id=self.tenant_id, label_columns=('opened',)
+            )
+
+            if skip:
+                print(f"⏭️  Skipping send_time_optimizer training: {reason}")
+                return False
+
+            print(f"Training data fingerprint: {reason}")
+
+        print(f"Fetching send time data{f' for tenant {self.tenant_id}' if self.tenant_id else ''}...")
         df = self.fetch_training_data()
 
         if len(df) < 100:
@@ -74,6 +106,34 @@ class SendTimeOptimizer:
             return
 
         print(f"Training on {len(df)} email sends")
+        print(f"🧮 {get_governor().summary()}")
+
+        mae = self.fit(df)
+
+        if mae is None:
+            self._create_dummy_model()
+            return
+
+        print(f"✅ Send Time Optimizer trained")
+        print(f"MAE: {mae:.4f}")
+
+        # Save
+        model_dir = trained_models_dir(self.tenant_id)
+        os.makedirs(model_dir, exist_ok=True)
+
+        model_path = os.path.join(model_dir, 'send_time_optimizer.pkl')
+        joblib.dump({
+            'model': self.model,
+            'feature_columns': self.feature_columns
+        }, model_path)
+
+        print(f"Model saved to {model_path}")
+
+        # Register in database
+        self._register_model(model_path, mae, self.training_groups)
+
+    def fit(self, df):
+        """Fit the regressor on per-slot open rates; returns training MAE (None if too little data)"""
 
         # Group by time slots and calculate open rate
         df_agg = df.groupby([
@@ -89,8 +149,7 @@ class SendTimeOptimizer:
 
         if len(df_agg) < 50:
             print(f"⚠️  Insufficient aggregated data ({len(df_agg)} groups). Creating dummy model...")
-            self._create_dummy_model()
-            return
+            return None
 
         print(f"Training on {len(df_agg)} time slot aggregates")
 
@@ -106,31 +165,71 @@ class SendTimeOptimizer:
             n_estimators=100,
             max_depth=10,
             random_state=42,
-            n_jobs=-1
+            n_jobs=thread_budget()
         )
         self.model.fit(X, y)
+        self.training_groups = len(df_agg)
 
         # Evaluate
         y_pred = self.model.predict(X)
-        mae = np.mean(np.abs(y - y_pred))
+        return float(np.mean(np.abs(y - y_pred)))
 
-        print(f"✅ Send Time Optimizer trained")
-        print(f"MAE: {mae:.4f}")
+    def predict_open_rates(self, slots_df):
+        """Predict open rate for each (day_of_week, hour_of_day, industry, function) row"""
 
-        # Save
-        model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
-        os.makedirs(model_dir, exist_ok=True)
+        # One-hot encoded straight into the training columns, so memory grows
+        # with the rows only (pd.get_dummies would first add a column per
+        # distinct category string). Categories the model never saw, and the
+        # baseline category training's drop_first dropped, stay all-zero.
+        column_index = {column: i for i, column in enumerate(self.feature_columns)}
+        X = np.zeros((len(slots_df), len(self.feature_columns)), dtype=np.float32)
 
-        model_path = os.path.join(model_dir, 'send_time_optimizer.pkl')
-        joblib.dump({
-            'model': self.model,
-            'feature_columns': self.feature_columns
-        }, model_path)
+        for feature in ('day_of_week', 'hour_of_day'):
+            if feature in column_index:
+                X[:, column_index[feature]] = slots_df[feature].to_numpy(dtype=np.float32)
 
-        print(f"Model saved to {model_path}")
+        for feature in ('industry', 'function'):
+            codes, values = pd.factorize(slots_df[feature])
+            # Trailing -1 is where missing values (code -1) land
+            positions = np.array([column_index.get(f'{feature}_{value}', -1) for value in values] + [-1])[codes]
+            rows = np.flatnonzero(positions >= 0)
+            X[rows, positions[rows]] = 1.0
 
-        # Register in database
-        self._register_model(model_path, mae, len(df_agg))
+        return self.model.predict(pd.DataFrame(X, columns=self.feature_columns, copy=False))
+
+    def _known_categories(self, feature):
+        """Values of a categorical feature that have their own training column"""
+
+        prefix = f'{feature}_'
+        return {column[len(prefix):] for column in self.feature_columns if column.startswith(prefix)}
+
+    @staticmethod
+    def latest_model_path(tenant_id=None):
+        """Latest send time model artifact for a tenant (or the global model); None if absent"""
+
+        model_dir = trained_models_dir(tenant_id)
+        model_files = [f for f in os.listdir(model_dir) if f.startswith('send_time_optimizer')] \
+            if os.path.isdir(model_dir) else []
+
+        return os.path.join(model_dir, sorted(model_files)[-1]) if model_files else None
+
+    def load_model(self, model_path=None, fallback_to_global=True, mmap_mode=None):
+        """Load a trained model (latest for this tenant, else the global one, if no path given)"""
+
+        if model_path is None:
+            model_path = self.latest_model_path(self.tenant_id)
+
+            if model_path is None and self.tenant_id and fallback_to_global:
+                model_path = self.latest_model_path(None)
+
+            if model_path is None:
+                raise FileNotFoundError('No trained model found')
+
+        loaded = joblib.load(model_path, mmap_mode=mmap_mode)
+        self.model = limit_model_threads(loaded['model'])
+        self.feature_columns = loaded['feature_columns']
+
+        return model_path
 
     def _create_dummy_model(self):
         """Create dummy model for insufficient data"""
@@ -140,7 +239,7 @@ class SendTimeOptimizer:
         self.feature_columns = ['dummy']
         self.model.fit([[0]], [0.3])
 
-        model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
+        model_dir = trained_models_dir(self.tenant_id)
         os.makedirs(model_dir, exist_ok=True)
 
         model_path = os.path.join(model_dir, 'send_time_optimizer_dummy.pkl')
@@ -155,59 +254,114 @@ class SendTimeOptimizer:
     def predict_best_time(self, company_industry, person_function):
         """Predict best send time for a specific recipient"""
 
-        if self.model is None:
-            model_dir = os.path.join(os.path.dirname(__file__), '..', 'trained_models')
-            model_files = [f for f in os.listdir(model_dir) if f.startswith('send_time_optimizer')]
+        return self.predict_best_time_batch([(company_industry, person_function)])[0]
+
+    def predict_best_time_batch(self, recipients):
+        """Best send time for each (industry, function) in recipients"""
+
+        columns = self.best_time_columns(recipients)
+
+        return [
+            {
+                'day_of_week': int(day),
+                'hour_of_day': int(hour),
+                'predicted_open_rate': float(rate)
+            }
+            for day, hour, rate in zip(
+                columns['day_of_week'], columns['hour_of_day'], columns['predicted_open_rate']
+            )
+        ]
+
+    def best_time_columns(self, recipients):
+        """
+        predict_best_time_batch as {column: numpy array}, without building a
+        dict per row. The slot grid is built and scored once per distinct
+        (industry, function), in one model call.
+        """
 
-            if not model_files:
+        if self.model is None:
+            try:
+                self.load_model()
+            except FileNotFoundError:
                 # Return default best time: Tuesday 10 AM
                 return {
-                    'day_of_week': 2,
-                    'hour_of_day': 10,
-                    'predicted_open_rate': 0.3
+                    'day_of_week': np.full(len(recipients), 2, dtype=np.int8),
+                    'hour_of_day': np.full(len(recipients), 10, dtype=np.int8),
+                    'predicted_open_rate': np.full(len(recipients), 0.3)
                 }
 
-            latest_model = sorted(model_files)[-1]
-            model_path = os.path.join(model_dir, latest_model)
+        if not recipients:
+            return {
+                'day_of_week': np.empty(0, dtype=np.int8),
+                'hour_of_day': np.empty(0, dtype=np.int8),
+                'predicted_open_rate': np.empty(0)
+            }
+
+        grid = self.slot_scores(recipients)
+        scores = grid['scores']
+
+        # Find best slot
+        best_idx = scores.argmax(axis=1)
+        best_rate = scores[np.arange(len(scores)), best_idx]
+
+        return {
+            'day_of_week': grid['days'][best_idx][grid['segment']],
+            'hour_of_day': grid['hours'][best_idx][grid['segment']],
+            'predicted_open_rate': best_rate[grid['segment']]
+        }
+
+    def slot_scores(self, recipients):
+        """
+        Predicted open rate of every (segment, slot) pair for a loaded model
+
+        Returns {'days', 'hours': slot grid (int8), 'scores': segments × slots,
+        'segment': each recipient's row in scores, 'segments': list of
+        (industry, function)}.
+        """
 
-            loaded = joblib.load(model_path)
-            self.model = loaded['model']
-            self.feature_columns = loaded['feature_columns']
+        # Index of each recipient's segment
+        segment_index = {}
+        inverse = np.fromiter(
+            (segment_index.setdefault(recipient, len(segment_index)) for recipient in recipients),
+            dtype=np.int64, count=len(recipients)
+        )
+
+        # Segments the model cannot tell apart (categories it never saw encode
+        # as all-zero) are scored once, so the grid is bounded by the model's
+        # categories rather than by the distinct strings in the campaign
+        known_industries, known_functions = self._known_categories('industry'), self._known_categories('function')
+        encoded_index = {}
+        encoded = np.fromiter(
+            (encoded_index.setdefault(
+                (industry if industry in known_industries else None,
+                 function if function in known_functions else None),
+                len(encoded_index)
+            ) for industry, function in segment_index),
+            dtype=np.int64, count=len(segment_index)
+        )
+        industries, functions = zip(*encoded_index)
 
         # Generate all possible time slots (7 days × 24 hours = 168 slots)
         # But we'll focus on business hours for practicality
-        slots = []
-        for day in range(7):  # Monday=1 to Sunday=0
-            for hour in range(7, 19):  # 7 AM to 6 PM
-                slots.append({
-                    'day_of_week': day,
-                    'hour_of_day': hour,
-                    'industry': company_industry,
-                    'function': person_function
-                })
-
-        df = pd.DataFrame(slots)
-        df = pd.get_dummies(df, drop_first=True)
-
-        # Add missing columns
-        for col in self.feature_columns:
-            if col not in df.columns:
-                df[col] = 0
-
-        # Reorder to match training
-        df = df[self.feature_columns]
-
-        # Predict open rate for each slot
-        predictions = self.model.predict(df)
+        days = np.repeat(np.arange(7, dtype=np.int8), 12)  # Monday=1 to Sunday=0
+        hours = np.tile(np.arange(7, 19, dtype=np.int8), 7)  # 7 AM to 6 PM
 
-        # Find best slot
-        best_idx = np.argmax(predictions)
-        best_slot = slots[best_idx]
+        slots_df = pd.DataFrame({
+            'day_of_week': np.tile(days, len(industries)),
+            'hour_of_day': np.tile(hours, len(industries)),
+            'industry': np.repeat(np.array(industries, dtype=object), len(days)),
+            'function': np.repeat(np.array(functions, dtype=object), len(days))
+        })
+
+        # Predict open rate for each slot, one row of the grid per segment
+        predictions = self.predict_open_rates(slots_df).reshape(len(industries), len(days))
 
         return {
-            'day_of_week': int(best_slot['day_of_week']),
-            'hour_of_day': int(best_slot['hour_of_day']),
-            'predicted_open_rate': float(predictions[best_idx])
+            'days': days,
+            'hours': hours,
+            'scores': predictions[encoded],
+            'segment': inverse,
+            'segments': list(segment_index)
         }
 
     def _register_model(self, model_path, mae, training_samples):
@@ -220,7 +374,7 @@ class SendTimeOptimizer:
             cur.execute("""
                 INSERT INTO ml_models (
                     model_name, model_version, model_type, model_path,
-                    feature_columns, metrics, status, deployed_at, training_samples
+                    feature_columns, metrics, status, deployed_at, training_samples, tenant_id
                 ) VALUES (
                     'send_time_optimizer',
                     %s,
@@ -230,14 +384,16 @@ class SendTimeOptimizer:
                     %s,
                     'deployed',
                     NOW(),
+                    %s,
                     %s
                 )
             """, [
                 datetime.now().strftime('%Y%m%d'),
                 model_path,
                 json.dumps(self.feature_columns),
-                json.dumps({'mae': mae}),
-                training_samples
+                json.dumps({'mae': mae, 'data_fingerprint': self.data_fingerprint}),
+                training_samples,
+                self.tenant_id
             ])
 
             conn.commit()
@@ -251,7 +407,14 @@ class SendTimeOptimizer:
 # Training/prediction script
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--predict', type=str, help='JSON input for prediction')
+    parser.add_argument('--predict', type=str,
+                        help='JSON {industry, function} for prediction, or a list of them for a batch ("-" reads stdin)')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help='arrow: Arrow IPC stream of day_of_week/hour_of_day/predicted_open_rate columns (needs pyarrow)')
+    parser.add_argument('--tenant', type=str, help='Train / predict with this tenant\'s model (default: global)')
+    parser.add_argument('--force', action='store_true', help='Train even if the training data fingerprint is unchanged')
+    parser.add_argument('--min-new-rows', type=int, default=default_min_new_rows(),
+                        help='Skip training when fewer rows were added or changed since the deployed model')
     args = parser.parse_args()
 
     db_config = {
@@ -262,22 +425,40 @@ if __name__ == '__main__':
         'password': os.getenv('DB_PASSWORD', '')
     }
 
-    optimizer = SendTimeOptimizer(db_config)
+    optimizer = SendTimeOptimizer(db_config, tenant_id=args.tenant)
 
     if args.predict:
         # Prediction mode
-        input_data = json.loads(args.predict)
-        result = optimizer.predict_best_time(
-            input_data.get('industry', 'unknown'),
-            input_data.get('function', 'unknown')
-        )
-        print(json.dumps(result))
+        if args.output_format == 'arrow' and not PYARROW_AVAILABLE:
+            print(json.dumps({'error': 'pyarrow is required for --output-format arrow'}))
+            sys.exit(1)
+
+        input_data = read_predict_input(args.predict)
+
+        if isinstance(input_data, list) or args.output_format == 'arrow':
+            recipients = [
+                (item.get('industry', 'unknown'), item.get('function', 'unknown'))
+                for item in (input_data if isinstance(input_data, list) else [input_data])
+            ]
+
+            if args.output_format == 'arrow':
+                write_arrow(optimizer.best_time_columns(recipients))
+            else:
+                print(json.dumps(optimizer.predict_best_time_batch(recipients)))
+        else:
+            result = optimizer.predict_best_time(
+                input_data.get('industry', 'unknown'),
+                input_data.get('function', 'unknown')
+            )
+            print(json.dumps(result))
 
     else:
         # Training mode
         try:
-            optimizer.train()
-            print(f"\n✅ Send Time Optimizer training complete!")
+            if optimizer.train(force=args.force, min_new_rows=args.min_new_rows) is False:
+                print(f"\n✅ Send Time Optimizer training skipped - deployed model is current")
+            else:
+                print(f"\n✅ Send Time Optimizer training complete!")
         except Exception as e:
             print(f"\n❌ Training failed: {e}")
             import traceback
@@ -0,0 +1,27 @@
+"""
+Tenant scoping for model training and artifacts
+"""
+
+import uuid
+
+
+def normalize_tenant_id(tenant_id):
+    """Canonical tenant UUID string, or None for the global model; raises ValueError otherwise"""
+
+    if tenant_id in (None, ''):
+        return None
+
+    return str(uuid.UUID(str(tenant_id)))
+
+
+def tenant_outcomes_filter(tenant_id):
+    """SQL clause restricting email_outcomes (alias eo) to one tenant; empty for the global model"""
+
+    tenant_id = normalize_tenant_id(tenant_id)
+    if tenant_id is None:
+        return ''
+
+    # email_outcomes has no tenant_id; people does (phase0 multitenancy).
+    # Inlined rather than bound so the same window SQL can be fingerprinted;
+    # safe because normalize_tenant_id only lets a UUID through.
+    return f"AND eo.person_id IN (SELECT id FROM people WHERE tenant_id = '{tenant_id}'::uuid)"
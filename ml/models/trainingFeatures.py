@@ -0,0 +1,74 @@
+"""
+Flattened Training Feature Table
+
+ml_training_features (db/migrations/2026_10_18_ml_training_features.sql)
+holds one typed row per email_outcome with the feature_store JSONB values
+already extracted, kept current by triggers on email_outcomes and
+feature_store. Trainers read it instead of joining feature_store when
+enabled with --feature-table or ML_USE_FEATURE_TABLE=1.
+
+It only holds the 180-day training window (ml_training_features_prune),
+and it is not row-for-row identical to the live query: each outcome uses
+the newest feature version of each entity (the live join repeats an
+outcome per version), and malformed numerics become the column default
+instead of failing the fetch.
+"""
+
+import os
+import statistics
+import time
+
+import psycopg2
+
+FEATURE_TABLE = 'ml_training_features'
+
+
+def feature_table_enabled():
+    return os.getenv('ML_USE_FEATURE_TABLE', '').lower() in ('1', 'true', 'yes')
+
+
+def benchmark_queries(db_config, queries, repeats=5):
+    """
+    Time each of {name: sql}: client wall time (execute + fetch all rows)
+    and server execution time / buffer usage from EXPLAIN ANALYZE. Runs are
+    interleaved after one warm-up each so cache state favours neither query.
+    """
+
+    conn = psycopg2.connect(**db_config)
+    results = {name: {'wall_ms': [], 'server_ms': []} for name in queries}
+
+    try:
+        cur = conn.cursor()
+
+        for sql in queries.values():
+            cur.execute(sql)
+            cur.fetchall()
+
+        for _ in range(repeats):
+            for name, sql in queries.items():
+                start = time.perf_counter()
+                cur.execute(sql)
+                results[name]['rows'] = len(cur.fetchall())
+                results[name]['wall_ms'].append((time.perf_counter() - start) * 1000)
+
+                cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+                plan = cur.fetchone()[0][0]
+                results[name]['server_ms'].append(plan['Execution Time'])
+                results[name]['shared_blocks_hit'] = plan['Plan'].get('Shared Hit Blocks')
+                results[name]['shared_blocks_read'] = plan['Plan'].get('Shared Read Blocks')
+
+        cur.close()
+    finally:
+        conn.close()
+
+    return {
+        name: {
+            'rows': r['rows'],
+            'wall_ms_median': round(statistics.median(r['wall_ms']), 2),
+            'wall_ms_min': round(min(r['wall_ms']), 2),
+            'server_ms_median': round(statistics.median(r['server_ms']), 2),
+            'shared_blocks_hit': r['shared_blocks_hit'],
+            'shared_blocks_read': r['shared_blocks_read']
+        }
+        for name, r in results.items()
+    }
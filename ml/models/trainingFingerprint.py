@@ -0,0 +1,201 @@
+"""
+Training Data Fingerprint
+
+Cheap per-day aggregate of the training window (row count, max sent_at and
+an order-independent checksum of ids and the label columns the trainer
+uses), plus a checksum of the feature_store rows of the entities the
+window references, and the training parameters that shape the data (e.g.
+negative_sample_rate). Compared against the fingerprint recorded in the
+deployed model's ml_models.metrics to skip retraining when nothing
+meaningful changed. Training windows are whole days, so repeated runs on
+the same day fingerprint the same rows.
+"""
+
+import hashlib
+import json
+import os
+
+import psycopg2
+
+# email_outcomes columns a trainer can use as labels (all of them by default)
+LABEL_COLUMNS = ('opened', 'clicked', 'replied', 'converted')
+
+
+def compute_fingerprint(db_config, window_sql, include_features=True, params=None, label_columns=LABEL_COLUMNS):
+    """
+    Fingerprint the email_outcomes rows matching window_sql (alias eo).
+    label_columns: the outcome columns the model trains on; changes to the
+    others (e.g. opens, for a conversion model) are not counted.
+    """
+
+    # Unset parameters are left out, so fingerprints recorded before a
+    # parameter existed still match its default
+    params = {key: value for key, value in (params or {}).items() if value is not None}
+
+    unknown = set(label_columns) - set(LABEL_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown label columns: {', '.join(sorted(unknown))}")
+    label_columns = [column for column in LABEL_COLUMNS if column in label_columns]
+    row_hash_sql = ' || '.join(['eo.id::text'] + [f'COALESCE(eo.{column}, FALSE)::text' for column in label_columns])
+
+    conn = psycopg2.connect(**db_config)
+
+    try:
+        cur = conn.cursor()
+
+        # SUM of per-row hashes is order-independent, so the checksum only
+        # changes when rows are added, removed or relabeled
+        cur.execute(f"""
+            SELECT
+                to_char(date_trunc('day', eo.sent_at), 'YYYY-MM-DD') as day,
+                COUNT(*) as row_count,
+                MAX(eo.sent_at) as max_sent_at,
+                SUM(hashtext({row_hash_sql})::bigint) as checksum
+            FROM email_outcomes eo
+            WHERE {window_sql}
+            GROUP BY 1
+            ORDER BY 1
+        """)
+        rows = cur.fetchall()
+
+        features = {}
+        if include_features:
+            # Only feature rows of the window's companies, people and emails,
+            # hashed by value: recomputes elsewhere (other tenants, entities
+            # outside the window) and re-saves of identical values don't count
+            cur.execute(f"""
+                WITH window_rows AS (
+                    SELECT eo.id, eo.company_id, eo.person_id
+                    FROM email_outcomes eo
+                    WHERE {window_sql}
+                ),
+                entities AS (
+                    SELECT 'company' as entity_type, company_id as entity_id FROM window_rows
+                    UNION
+                    SELECT 'person', person_id FROM window_rows
+                    UNION
+                    SELECT 'email', id FROM window_rows
+                )
+                SELECT
+                    fs.entity_type,
+                    COUNT(*),
+                    SUM(hashtext(fs.entity_id::text || fs.feature_version || fs.features::text)::bigint)
+                FROM feature_store fs
+                JOIN entities e ON e.entity_type = fs.entity_type AND e.entity_id = fs.entity_id
+                GROUP BY fs.entity_type
+                ORDER BY fs.entity_type
+            """)
+            features = {
+                entity_type: [count, str(checksum)]
+                for entity_type, count, checksum in cur.fetchall()
+            }
+
+        cur.close()
+    finally:
+        conn.close()
+
+    days = {day: [count, str(checksum)] for day, count, _, checksum in rows}
+    max_sent_at = max((r[2] for r in rows), default=None)
+
+    return {
+        'row_count': sum(count for count, _ in days.values()),
+        'max_sent_at': max_sent_at.isoformat() if max_sent_at else None,
+        'days': days,
+        'features': features,
+        'labels': label_columns,
+        'params': params,
+        'digest': hashlib.sha256(json.dumps([days, features, params], sort_keys=True).encode()).hexdigest()
+    }
+
+
+def deployed_fingerprint(db_config, model_name, tenant_id=None):
+    """Fingerprint recorded by the most recently deployed model (None if absent)"""
+
+    conn = psycopg2.connect(**db_config)
+
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT metrics->'data_fingerprint'
+            FROM ml_models
+            WHERE model_name = %s AND status = 'deployed' AND tenant_id IS NOT DISTINCT FROM %s::uuid
+            ORDER BY deployed_at DESC
+            LIMIT 1
+        """, [model_name, tenant_id])
+        row = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+
+    return row[0] if row else None
+
+
+def compare_fingerprints(current, deployed, min_new_rows=0):
+    """Returns (skip, reason)"""
+
+    if not deployed:
+        return False, 'no fingerprint recorded for the deployed model'
+
+    if current['digest'] == deployed.get('digest'):
+        return True, f"training inputs unchanged ({current['row_count']} rows, max sent_at {current['max_sent_at']})"
+
+    if current.get('params', {}) != deployed.get('params', {}):
+        return False, f"training parameters changed ({deployed.get('params', {})} -> {current.get('params', {})})"
+
+    if current.get('labels') != deployed.get('labels', list(LABEL_COLUMNS)):
+        return False, 'fingerprinted label columns changed'
+
+    if current['features'] != deployed.get('features'):
+        return False, "feature_store rows of the window's entities changed"
+
+    # Days that aged out of the sliding window are ignored, as is the oldest
+    # day shrinking (a fingerprint recorded mid-day by an older, NOW()-relative
+    # window). Added rows count once; a day whose checksum changed without
+    # gaining rows was relabeled or had rows removed, so all of its rows count
+    # since the aggregate can't say how many changed.
+    old_days = deployed.get('days', {})
+    oldest_day = min(current['days'], default=None)
+    changed_rows = 0
+    for day, (count, checksum) in current['days'].items():
+        if day not in old_days:
+            changed_rows += count
+        elif count > old_days[day][0]:
+            changed_rows += count - old_days[day][0]
+        elif old_days[day][1] != checksum and not (day == oldest_day and count < old_days[day][0]):
+            changed_rows += count
+
+    aged_out = len(set(old_days) - set(current['days']))
+
+    if changed_rows == 0:
+        return True, f'no new or changed rows ({aged_out} days aged out of the window)'
+
+    if changed_rows < min_new_rows:
+        return True, f'only {changed_rows} new or changed rows (threshold {min_new_rows})'
+
+    return False, f'{changed_rows} new or changed rows'
+
+
+def check_training_fingerprint(db_config, model_name, window_sql, min_new_rows=0, include_features=True,
+                               tenant_id=None, params=None, label_columns=LABEL_COLUMNS):
+    """
+    Returns (skip, reason, fingerprint); never skips if fingerprinting itself
+    fails. params: training parameters that must match the deployed model's;
+    label_columns: the outcome columns the model trains on
+    """
+
+    try:
+        current = compute_fingerprint(db_config, window_sql, include_features, params, label_columns)
+    except Exception as e:
+        return False, f'fingerprint unavailable: {e}', None
+
+    try:
+        deployed = deployed_fingerprint(db_config, model_name, tenant_id)
+    except Exception as e:
+        return False, f'deployed fingerprint unavailable: {e}', current
+
+    skip, reason = compare_fingerprints(current, deployed, min_new_rows)
+    return skip, reason, current
+
+
+def default_min_new_rows():
+    return int(os.getenv('ML_RETRAIN_MIN_NEW_ROWS', 0))